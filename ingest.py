@@ -1,86 +1,202 @@
-def write_file_contents(output_file):
+import os
+import mmap
+import stat
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_OPEN_WORKERS = 8
+
+# Output markers, encoded once
+FILE_HEADER = "File: {}\n".format
+FILE_TRAILER = b"\n\n"
+FILE_NOT_FOUND = b"File not found.\n\n"
+NOT_A_REGULAR_FILE = b"Not a regular file.\n\n"
+
+
+def _open_source(file_path):
+    """
+    Open a source file and ask the kernel to start reading it ahead.
+
+    Returns:
+        tuple: the open descriptor and its stat result. The descriptor is
+            None for empty files and for directories and other non-regular
+            files, which are never opened.
+    """
+    st = os.stat(file_path)
+    if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+        return None, st
+
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        st = os.fstat(fd)
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd, st
+
+
+def _copy_with_sendfile(out_fd, fd, size):
+    """
+    Copy a file into the output descriptor inside the kernel.
+
+    Returns:
+        bool: False if sendfile is not supported for this pair of files.
+    """
+    if not hasattr(os, "sendfile"):
+        return False
+
+    offset = 0
+    while offset < size:
+        try:
+            sent = os.sendfile(out_fd, fd, offset, size - offset)
+        except OSError:
+            if offset == 0:
+                return False
+            raise
+        if sent == 0:
+            break
+        offset += sent
+    return True
+
+
+def _copy_with_mmap(out_fd, fd):
+    """Write a regular file through a read-only mapping of its pages."""
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        _writev_all(out_fd, [mm])
+
+
+def _writev_all(out_fd, buffers):
+    """Gather-write all buffers in as few syscalls as possible, resuming after short writes."""
+    views = [memoryview(buf) for buf in buffers if len(buf)]
+    while views:
+        written = os.writev(out_fd, views)
+        while views and written >= len(views[0]):
+            written -= len(views.pop(0))
+        if views and written:
+            views[0] = views[0][written:]
+
+
+FILES_TO_READ = [
+    "./src/core/node.py",
+    "./src/core/tracker.py",
+
+    "./src/network/messages.py",
+    "./src/network/connection.py",
+    # "./src/network/dht.py",
+
+    "./src/states/seeder_state.py",
+    "./src/states/leecher_state.py",
+
+    "./src/strategies/choking.py",
+    "./src/strategies/piece_selection.py",
+
+    "./src/torrent/parser.py",
+    "./src/torrent/bencode.py",
+    "./src/torrent/piece_manager.py",
+    "./src/torrent/bitfield.py",
+    "./src/torrent/magnet_processor.py",
+
+    # "./src/utils/logger.py",
+    # "./src/utils/serialization.py",
+
+    "./src/config.py",
+    "main.py",
+
+    # "tests/core/test_node.py",
+    # "tests/core/test_tracker.py",
+
+    # "tests/network/test_connection.py",
+    # "tests/network/test_message.py",
+
+    # "tests/states/test_downloading.py",
+    # "tests/states/test_endgame.py",
+    # "tests/states/test_peer_discovery.py",
+    # "tests/states/test_seeder.py",
+
+    # "tests/strategies/test_choking.py",
+    # "tests/strategies/test_performance.py",
+    # "tests/strategies/test_piece_selection.py",
+
+    # "tests/torrent/test_bencode.py",
+    # "tests/torrent/test_parser.py",
+
+    # "./reference/code/client.py",
+    # "./reference/code/merge.py",
+    # "./reference/code/tracker.py",
+    # "./reference/code/deal_torrent.py",
+    # "./reference/code/metainfo.torrent",
+    # "./reference/docs/Specification.md",
+]
+
+
+def write_file_contents(output_file, files_to_read=FILES_TO_READ):
     """
     Writes the contents of specific files to the output file in the desired format.
 
     Args:
         output_file (str): The name of the file to write the contents to.
+        files_to_read (List[str]): Paths to concatenate, in output order.
     """
-    files_to_read = [
-        "./src/core/node.py",
-        "./src/core/tracker.py",
-
-        "./src/network/messages.py",
-        "./src/network/connection.py",
-        # "./src/network/dht.py",
-
-        "./src/states/seeder_state.py",
-        "./src/states/leecher_state.py",
-
-        "./src/strategies/choking.py",
-        "./src/strategies/piece_selection.py",
-
-        "./src/torrent/parser.py",
-        "./src/torrent/bencode.py",
-        "./src/torrent/piece_manager.py",
-        "./src/torrent/magnet_processor.py",
-
-        # "./src/utils/logger.py",
-        # "./src/utils/serialization.py",
-
-        "./src/config.py",
-        "main.py",
-
-        # "tests/core/test_node.py",
-        # "tests/core/test_tracker.py",
-
-        # "tests/network/test_connection.py",
-        # "tests/network/test_message.py",
-
-        # "tests/states/test_downloading.py",
-        # "tests/states/test_endgame.py",
-        # "tests/states/test_peer_discovery.py",
-        # "tests/states/test_seeder.py",
-        
-        # "tests/strategies/test_choking.py",
-        # "tests/strategies/test_performance.py",
-        # "tests/strategies/test_piece_selection.py",
-
-        # "tests/torrent/test_bencode.py",
-        # "tests/torrent/test_parser.py",
-
-        # "./reference/code/client.py",
-        # "./reference/code/merge.py",
-        # "./reference/code/tracker.py",
-        # "./reference/code/deal_torrent.py",
-        # "./reference/code/metainfo.torrent",
-        # "./reference/docs/Specification.md",
-    ]
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        for file_path in files_to_read:
-            try:
-                with open(file_path, "r", encoding="utf-8") as file:
-                    # Write file separator and name
-                    # f.write(f"================================================\n")
-                    f.write(f"File: {file_path}\n")
-                    # f.write(f"================================================\n")
-                    # Write content
-                    f.write(file.read())
-                    f.write("\n\n")
-            except FileNotFoundError:
-                # f.write(f"================================================\n")
-                f.write(f"File: {file_path}\n")
-                # f.write(f"================================================\n")
-                f.write("File not found.\n\n")
-            except Exception as e:
-                # f.write(f"================================================\n")
-                f.write(f"File: {file_path}\n")
-                # f.write(f"================================================\n")
-                f.write(f"Error reading file: {e}\n\n")
-
-# Specify the output file name
-output_filename = "local.txt"
-
-# Write the contents to local.txt
-write_file_contents(output_filename)
-print(f"File contents have been written to {output_filename}.")
+    out_fd = os.open(output_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    workers = max(1, min(MAX_OPEN_WORKERS, len(files_to_read)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Open every file up front so slow opens overlap, then consume
+            # the results in list order to keep the output ordering
+            futures = [pool.submit(_open_source, path) for path in files_to_read]
+
+            # Headers, trailers and error markers are queued here and flushed
+            # together with a single writev right before the next file body
+            pending = []
+            for file_path, future in zip(files_to_read, futures):
+                header = FILE_HEADER(file_path).encode()
+                try:
+                    fd, st = future.result()
+                except FileNotFoundError:
+                    pending += [header, FILE_NOT_FOUND]
+                    continue
+                except Exception as e:
+                    pending += [header, f"Error reading file: {e}\n\n".encode()]
+                    continue
+
+                if fd is None:
+                    if not stat.S_ISREG(st.st_mode):
+                        pending += [header, NOT_A_REGULAR_FILE]
+                        continue
+                    # Empty or pseudo file, its size can't be trusted
+                    try:
+                        pending += [header, Path(file_path).read_bytes(), FILE_TRAILER]
+                    except Exception as e:
+                        pending += [header, f"Error reading file: {e}\n\n".encode()]
+                    continue
+
+                pending.append(header)
+                try:
+                    _writev_all(out_fd, pending)
+                    pending.clear()
+                    # Let the kernel copy the content straight from the page
+                    # cache, or map it when sendfile can't target the output
+                    if not _copy_with_sendfile(out_fd, fd, st.st_size):
+                        _copy_with_mmap(out_fd, fd)
+                    pending.append(FILE_TRAILER)
+                except Exception as e:
+                    pending.append(f"Error reading file: {e}\n\n".encode())
+                finally:
+                    os.close(fd)
+
+            _writev_all(out_fd, pending)
+    finally:
+        os.close(out_fd)
+
+
+if __name__ == "__main__":
+    # Specify the output file name
+    output_filename = "local.txt"
+
+    # Write the contents to local.txt
+    write_file_contents(output_filename)
+    print(f"File contents have been written to {output_filename}.")
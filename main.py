@@ -3,6 +3,7 @@
 import os
 import sys
 import time
+import heapq
 import logging
 import argparse
 import threading
@@ -11,6 +12,7 @@ from src.core.tracker import Tracker
 from src.core.node import Node
 from src.torrent.parser import TorrentParser
 from src.torrent.piece_manager import PieceManager
+from src.torrent.bitfield import Bitfield
 from src.strategies.piece_selection import PieceSelectionManager
 from src.strategies.choking import TitForTatStrategy, OptimisticUnchokeStrategy
 from src.states.node_state import NodeStateType
@@ -27,6 +29,40 @@ def setup_logger(log_level: str = 'INFO') -> None:
     logging.info(f"Logging initialized at {logging.getLevelName(level)} level")
 
 
+def run_periodic_jobs(jobs: list, stop: threading.Event, until=None,
+                      until_interval: float = config.COMPLETION_CHECK_INTERVAL) -> bool:
+    """
+    Run (interval, callback) jobs on a heap of monotonic deadlines.
+
+    Args:
+        jobs(list): (interval in seconds, callback) pairs
+        stop(threading.Event): set to stop waiting
+        until(Callable[[], bool]): optional condition checked after every wakeup
+        until_interval(float): longest wait between two checks of `until`
+
+    Returns:
+        bool: True if `until` became true, False if stopped
+    """
+    start = time.monotonic()
+    deadlines = [(start + interval, index, interval, callback)
+                 for index, (interval, callback) in enumerate(jobs)]
+    heapq.heapify(deadlines)
+
+    while not (until and until()):
+        when, index, interval, callback = deadlines[0]
+        wait = max(0, when - time.monotonic())
+        if until:
+            # Wake up in time to notice `until` even when no job is due
+            wait = min(wait, until_interval)
+        if stop.wait(wait):
+            return False
+        if time.monotonic() < when:
+            continue
+        callback()
+        heapq.heapreplace(deadlines, (when + interval, index, interval, callback))
+    return True
+
+
 def load_torrent(file_path: str) -> dict:
     """Load and parse a torrent file"""
     if not os.path.exists(file_path):
@@ -53,8 +89,8 @@ def run_seeder(torrent_data: dict, data_dir: str, tracker_host: str, tracker_por
     piece_manager.init_storage(torrent_data['name'])
     
     # Mark all pieces as available for the seeder
-    all_pieces = set(range(len(torrent_data['pieces_hashes'])))
-    seeder.my_pieces = all_pieces
+    piece_count = len(torrent_data['pieces_hashes'])
+    seeder.my_pieces = Bitfield(piece_count, fill=True)
     seeder.piece_manager = piece_manager
     
     # Set up strategies
@@ -69,14 +105,14 @@ def run_seeder(torrent_data: dict, data_dir: str, tracker_host: str, tracker_por
         logging.error("Seeder failed to connect to tracker")
 
     # Keep running until interrupted
+    stop = threading.Event()
     try:
-        while True:
-            time.sleep(1)
-            # Display stats every 10 seconds
-            if int(time.time()) % 10 == 0:
-                logging.info(f"Seeder stats: {len(seeder.peer_connections)} connections, "
-                             f"serving {len(seeder.my_pieces)} pieces")
+        # Display stats every interval
+        while not stop.wait(config.SEEDER_STATS_INTERVAL):
+            logging.info(f"Seeder stats: {len(seeder.peer_connections)} connections, "
+                         f"serving {piece_count} pieces")
     except KeyboardInterrupt:
+        stop.set()
         logging.info("Stopping seeder...")
         if hasattr(seeder, 'stop'):
             seeder.stop()
@@ -142,6 +178,8 @@ def run_leecher(torrent_data: dict, data_dir: str, tracker_host: str, tracker_po
     leecher.start()
     logging.info(f"Leecher started with address: {leecher.address}")
 
+    piece_count = len(torrent_data['pieces_hashes'])
+
     # Set up piece manager for downloading
     piece_manager = PieceManager(
         output_dir=data_dir,
@@ -151,10 +189,11 @@ def run_leecher(torrent_data: dict, data_dir: str, tracker_host: str, tracker_po
     )
     piece_manager.init_storage(torrent_data['name'])
     leecher.piece_manager = piece_manager
+    leecher.my_pieces = Bitfield(piece_count)
     
     # Set up strategies
     leecher.piece_selection_manager = PieceSelectionManager(
-        piece_count=len(torrent_data['pieces_hashes']),
+        piece_count=piece_count,
         max_pipeline_depth=config.DEFAULT_PIPELINE_DEPTH
     )
     leecher.upload_manager.set_strategy(OptimisticUnchokeStrategy())
@@ -165,31 +204,36 @@ def run_leecher(torrent_data: dict, data_dir: str, tracker_host: str, tracker_po
     else:
         logging.error("Leecher failed to connect to tracker")
 
+    def log_progress():
+        progress = piece_manager.get_download_progress()
+        peers = len(leecher.peer_connections)
+        logging.info(f"Download progress: {progress:.1f}%, Connected peers: {peers}")
+
+    def request_peers_if_stuck():
+        # Check if we're stuck with no peers
+        if not leecher.peer_connections:
+            logging.info("No peers available, requesting from tracker...")
+            leecher.request_peers_from_tracker()
+
     # Keep running until download completes or interrupted
+    stop = threading.Event()
     try:
-        while not piece_manager.is_complete():
-            # Display progress
-            if int(time.time()) % 5 == 0:
-                progress = piece_manager.get_download_progress()
-                peers = len(leecher.peer_connections)
-                logging.info(f"Download progress: {progress:.1f}%, Connected peers: {peers}")
-            
-            # Check if we're stuck with no peers
-            if not leecher.peer_connections and int(time.time()) % 30 == 0:
-                logging.info("No peers available, requesting from tracker...")
-                leecher.request_peers_from_tracker()
-                
-            time.sleep(1)
-            
+        jobs = [
+            (config.LEECHER_PROGRESS_INTERVAL, log_progress),
+            (config.LEECHER_PEER_REQUEST_INTERVAL, request_peers_if_stuck)
+        ]
+        if not run_periodic_jobs(jobs, stop, until=piece_manager.is_complete):
+            return
+
         logging.info("Download complete! Now seeding...")
         leecher.transition_state(NodeStateType.SEEDING)
         
         # Keep seeding
-        while True:
-            time.sleep(10)
+        while not stop.wait(config.SEEDER_STATS_INTERVAL):
             logging.info(f"Seeding to {len(leecher.peer_connections)} peers...")
             
     except KeyboardInterrupt:
+        stop.set()
         logging.info("Stopping leecher...")
         if hasattr(leecher, 'stop'):
             leecher.stop()
@@ -217,7 +261,7 @@ def run_tracker(host: str = config.DEFAULT_TRACKER_HOST,
         logging.error(f"Failed to start tracker: {e}", exc_info=True)
 
 
-def run_demo(torrent_file: str) -> None:
+def run_demo(torrent_file: str, real_random: bool = False) -> None:
     """Run a complete demo with one tracker, one seeder and two leechers"""
     setup_logger('INFO')
     
@@ -237,11 +281,16 @@ def run_demo(torrent_file: str) -> None:
         with open(file_path, 'wb') as f:
             # MP4 header + random data
             f.write(b'\x00\x00\x00\x14ftypmp42\x00\x00\x00\x00mp42mp41\x00\x00')
-            remaining = torrent_data['length'] - 24
-            while remaining > 0:
-                chunk = min(remaining, 1024*1024)
-                f.write(os.urandom(chunk))
-                remaining -= chunk
+            if real_random:
+                remaining = torrent_data['length'] - 24
+                while remaining > 0:
+                    chunk = min(remaining, config.DEMO_FILE_CHUNK_SIZE)
+                    f.write(os.urandom(chunk))
+                    remaining -= chunk
+            else:
+                # Sparse zero-filled body, sized in a single syscall
+                f.flush()
+                os.ftruncate(f.fileno(), torrent_data['length'])
     
     # Start tracker in a separate thread
     tracker_host = '127.0.0.1'
@@ -314,6 +363,8 @@ def main():
     # Demo command
     demo_parser = subparsers.add_parser('demo', help='Run full system demo')
     demo_parser.add_argument('--torrent', required=True, help='Path to torrent file')
+    demo_parser.add_argument('--real-random', action='store_true',
+                             help='Fill the demo file with random data instead of a sparse file')
     
     # Parse arguments
     args = parser.parse_args()
@@ -331,7 +382,7 @@ def main():
         torrent_data = load_torrent(args.torrent)
         run_leecher(torrent_data, args.dir, args.tracker_host, args.tracker_port)
     elif args.command == 'demo':
-        run_demo(args.torrent)
+        run_demo(args.torrent, args.real_random)
     else:
         # If no command provided, run the demo with a default torrent
         if os.path.exists('example.torrent'):
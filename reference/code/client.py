@@ -1,7 +1,11 @@
 import socket
 import threading
 import time
-import bencodepy 
+try:
+    # C implementation, decodes large torrents much faster
+    from fastbencode import bdecode
+except ImportError:
+    from bencodepy import decode as bdecode
 import os
 import sys
 import hashlib
@@ -9,21 +13,52 @@ import signal
 import logging
 import queue
 import json
-import keyboard
 import struct
+import selectors
 import random
-from merge import merge
-from concurrent.futures import ThreadPoolExecutor
-from collections import defaultdict
+import functools
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import Counter, defaultdict, deque
+from itertools import chain
 
 
 METAINFO_PATH = 'metainfo.torrent'
-BUFFER_SIZE = 1024
 MAX_THREADS_LISTENER = 100
+MAX_THREADS_DOWNLOAD = 64
+PIECE_CACHE_SIZE = 128 # pieces kept in memory for uploading, 64MB of 512KB pieces
+SENDFILE_UPLOAD = True # upload pieces with sendfile(2) instead of the in-memory cache
+TRACKER_UPDATE_BATCH = 64 # max pieces per UPDATE_PIECES message
+TRACKER_UPDATE_FLUSH_INTERVAL = 0.05 # seconds a batch waits for more pieces
+TRACKER_UPDATE_RETRY_DELAY = 1 # seconds before resending a batch the tracker didn't get
+# Tracker command frames, must match tracker.py
+OP_REGISTER = 1
+OP_UPDATE_PIECE = 2
+OP_GET_PEERS_DICT = 3
+OP_UNREGISTER = 4
+OP_UPDATE_PIECES = 5
+PORT_FRAME = struct.Struct('>BH') # opcode, peer port
+UPDATE_PIECE_FRAME = struct.Struct('>BH20s') # opcode, peer port, piece digest
+REGISTER_FRAME = struct.Struct('>BHI') # opcode, peer port, hash count, then the digests
 FILE_NAME = ''
+PIECE_LENGTH = 0
+FILE_LENGTH = 0
+PIECE_INDEX = {} # piece hash -> index of the piece in the file
+OUTPUT_FILE = None # downloaded file, pieces are pwritten at index * PIECE_LENGTH
+LISTED_PIECES = set() # pieces found as files in list_pieces at startup
+# Reused by every download cycle instead of one new thread per peer
+DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=MAX_THREADS_DOWNLOAD)
+# GET_PEERS_DICT codecs this client accepts, in order of preference: name -> (flag, decompress)
+DECOMPRESSORS = {}
+try:
+    import zstandard
+    DECOMPRESSORS["zstd"] = (b"Z", lambda data: zstandard.ZstdDecompressor().decompress(data))
+except ImportError:
+    pass
+DECOMPRESSORS["zlib"] = (b"D", zlib.decompress)
 #lock
 pieces_downloaded_count_lock = threading.Lock()
-hash_dict_lock = threading.Lock()
+bitfield_lock = threading.Lock()
 hash_dict_vailable_count_lock = threading.Lock()
 peer_dict_lock = threading.Lock()
 download_rate_dict_lock = threading.Lock()
@@ -38,18 +73,30 @@ choke_lock = threading.Lock()
 SEEDER = True
 END_GAME_MODE = False
 PROGRAM_IS_RUNNING = True
+SHUTDOWN_EVENT = threading.Event() # set by stop() once the client left the network
 INTERVAL_CYCLE = 5
 UNCHOKE_INTERVAL = 15
+CHOKE_INTERVAL = 4
 PIECES_COUNT = 0
 PIECES_DOWNLOADED_COUNT = 0 
 
-HASH_DICT = {} 
+BITFIELD = bytearray() # one byte per piece index, 1 once the piece is downloaded
 HASH_DICT_AVAILABLE_COUNT = {} 
+HASH_LIST_CACHE = None # serialized hash list for the tracker, see cached_hash_list
+HASH_LIST_LENGTH = 0
+HASH_LIST_DIRTY = True
 PEER_DICT = {}
+PIECE_TO_PEERS = {} # piece hash -> peers owning it, fastest first
+TRACKER_UPDATE_QUEUE = queue.Queue() # downloaded pieces not yet reported to the tracker
 TOTAL_DOWNLOADED = {}
 
-CHOKED_QUEUE = queue.Queue()
-UNCHOKE = []
+CHOKED_QUEUE = deque() # FIFO of choked peers, guarded by choke_lock
+CHOKED_SET = set() # same peers as CHOKED_QUEUE, for O(1) membership
+UNCHOKE = set()
+UNCHOKE_EVENTS = defaultdict(threading.Event) # set while the peer is unchoked
+unchoke_events_lock = threading.Lock()
+CHOKED_PEERS = threading.Event() # set while CHOKED_QUEUE may have peers, wakes unchoke_periodly
+UNCHOKED_PEERS = threading.Event() # set while UNCHOKE may have peers, wakes choke_periodly
 DOWNLOAD_RATE_DICT = {}
 
 with open("config.json", 'r') as f:
@@ -96,10 +143,83 @@ def load_file(file_path):
         print(f"File {file_path} not found!")
         return None
 
+def new_tcp_socket():
+    # control messages are tiny, don't let Nagle hold them back
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def sha1_hex(data):
+    # piece checksum only, not a security boundary; OpenSSL hashes the buffer
+    # without the GIL and uses the CPU's SHA instructions when available
+    digest = hashlib.new('sha1', usedforsecurity=False)
+    digest.update(memoryview(data))
+    return digest.hexdigest()
+
+def open_output_file(file_name, file_length):
+    # pieces are written in place with pwrite, so reserve the whole file once
+    fd = os.open(file_name, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size < file_length:
+            try:
+                os.posix_fallocate(fd, 0, file_length)
+            except (AttributeError, OSError):
+                # no fallocate on this platform or filesystem, fall back to a sparse file
+                os.ftruncate(fd, file_length)
+    except Exception:
+        os.close(fd)
+        raise
+    return open(fd, 'r+b', buffering=0)
+
+def output_region(piece_hash):
+    # offset and size of a piece inside the output file
+    offset = PIECE_INDEX[piece_hash] * PIECE_LENGTH
+    return offset, min(PIECE_LENGTH, FILE_LENGTH - offset)
+
+def downloaded_region(piece_hash):
+    # pieces downloaded by this client only exist inside the output file
+    index = PIECE_INDEX.get(piece_hash)
+    if OUTPUT_FILE is None or index is None or not BITFIELD[index]:
+        raise FileNotFoundError(f"Piece {piece_hash} not downloaded")
+    return output_region(piece_hash)
+
+@functools.lru_cache(maxsize=PIECE_CACHE_SIZE)
+def load_piece(piece_hash):
+    # pieces are immutable once verified, so the bytes can be shared between uploads
+    # raises FileNotFoundError for missing pieces, which is never cached
+    try:
+        with open(f'list_pieces/{piece_hash}.bin', 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        offset, size = downloaded_region(piece_hash)
+        return os.pread(OUTPUT_FILE.fileno(), size, offset)
+
+def send_piece_file(sock, piece_hash):
+    # same framing as send_msg, but the body goes from the page cache straight to the socket
+    try:
+        with open(f'list_pieces/{piece_hash}.bin', 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            sock.sendall(struct.pack('>I', size))
+            sock.sendfile(file, 0, size)
+    except FileNotFoundError:
+        offset, size = downloaded_region(piece_hash)
+        sock.sendall(struct.pack('>I', size))
+        sock.sendfile(OUTPUT_FILE, offset, size)
+    return size
+
 def send_msg(sock, msg):
     try:
-        msg = struct.pack('>I', len(msg)) + msg
-        sock.sendall(msg)
+        # Header and body go out as one gathered write, the body is never copied
+        buffers = [struct.pack('>I', len(msg)), memoryview(msg)]
+        remaining = 4 + len(msg)
+        while remaining:
+            sent = sock.sendmsg(buffers)
+            remaining -= sent
+            # Short write, skip what the kernel already took and send the rest
+            while remaining and sent >= len(buffers[0]):
+                sent -= len(buffers.pop(0))
+            if remaining and sent:
+                buffers[0] = memoryview(buffers[0])[sent:]
     except Exception as e:
         logging.error(f"Error sending message: {e}")
 
@@ -114,6 +234,13 @@ def recv_msg(sock):
         logging.error(f"Error receiving message: {e}")
         return None
 
+def send_text(sock, text):
+    send_msg(sock, text.encode())
+
+def recv_text(sock):
+    msg = recv_msg(sock)
+    return msg.decode() if msg else ""
+
 def recvall(sock, n):
     data = bytearray()
     while len(data) < n:
@@ -125,21 +252,55 @@ def recvall(sock, n):
 
 ###############################################
 ## furthur function
-def check_for_exit(this_ip, this_port, tracker_URL):
+def stop(this_ip, this_port, tracker_URL):
+    # SIGINT/SIGTERM handler, leave the network once
     global PROGRAM_IS_RUNNING
-    i = input()
+    if not PROGRAM_IS_RUNNING:
+        return
     logging.info("==================== Exiting network... =============")
     PROGRAM_IS_RUNNING = False
+    # wake the idle choke schedulers so they see PROGRAM_IS_RUNNING
+    CHOKED_PEERS.set()
+    UNCHOKED_PEERS.set()
     unregister(this_ip, this_port, tracker_URL)
+    SHUTDOWN_EVENT.set()
 
 def check_existing_pieces():
-    global HASH_DICT,PIECES_DOWNLOADED_COUNT
-    existing_pieces = os.listdir('list_pieces')
-    for file in existing_pieces:
-        if file.endswith('.bin'):
-            piece_hash = file[:-4]
-            HASH_DICT[piece_hash] = 1
+    global PIECES_DOWNLOADED_COUNT,HASH_LIST_DIRTY
+    with os.scandir('list_pieces') as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith('.bin') or not entry.is_file():
+                continue
+            index = PIECE_INDEX.get(name[:-4])
+            if index is None or BITFIELD[index]:
+                continue
+            BITFIELD[index] = 1
+            HASH_LIST_DIRTY = True
             PIECES_DOWNLOADED_COUNT += 1
+            LISTED_PIECES.add(name[:-4])
+
+def check_output_pieces():
+    # pieces written into the output file by an earlier run
+    global PIECES_DOWNLOADED_COUNT, HASH_LIST_DIRTY
+    fd = OUTPUT_FILE.fileno()
+    for piece_hash, index in PIECE_INDEX.items():
+        if not BITFIELD[index]:
+            offset, size = output_region(piece_hash)
+            if sha1_hex(os.pread(fd, size, offset)) == piece_hash:
+                BITFIELD[index] = 1
+                HASH_LIST_DIRTY = True
+                PIECES_DOWNLOADED_COUNT += 1
+
+def write_listed_pieces():
+    # pieces kept as separate files in list_pieces are not in the output file yet
+    if OUTPUT_FILE is None:
+        return
+    fd = OUTPUT_FILE.fileno()
+    for piece_hash in LISTED_PIECES:
+        if piece_hash in PIECE_INDEX:
+            offset, _ = output_region(piece_hash)
+            os.pwrite(fd, load_file(f'list_pieces/{piece_hash}.bin'), offset)
 
 def update_downloaded_count_and_print():
     global PIECES_DOWNLOADED_COUNT
@@ -159,7 +320,7 @@ def read_torrent_file(torrent_file_path):
         start_time = time.time()
         try:
             with open(torrent_file_path, 'rb') as torrent_file:
-                torrent_data = bencodepy.decode(torrent_file.read())
+                torrent_data = bdecode(torrent_file.read())
         except IOError:
             if time.time() - start_time > 3:
                 raise TimeoutError(f"File {torrent_file_path} is still in use after {3} seconds.")
@@ -170,65 +331,148 @@ def read_torrent_file(torrent_file_path):
         piece_length = info.get(b'piece length', 0)  # 512KB
         pieces = info.get(b'pieces')  # list hash       
         file_length = info.get(b'length')
-        pieces_count = len(pieces)
-        # default bitfield 0 indicate client has not had this piece 
-        hash_dict = {piece_hash.decode(): 0 for piece_hash in pieces.keys()} 
+        if isinstance(pieces, (bytes, bytearray)):
+            # Standard torrent: one contiguous blob of 20-byte SHA-1 digests
+            view = memoryview(pieces)
+            piece_hashes = [view[i:i + 20].hex() for i in range(0, len(view), 20)]
+        else:
+            # deal_torrent.py format: dict of hex hash -> piece path
+            piece_hashes = [piece_hash.decode() for piece_hash in pieces]
+        pieces_count = len(piece_hashes)
+        # availability count of every piece, 0 until a peer reports it
+        hash_dict = dict.fromkeys(piece_hashes, 0)
     except Exception as e:
         logging.error(f"Error when dealing with torrent file: {e}")
     return hash_dict, tracker_URL, file_name, piece_length, pieces, file_length, pieces_count        
 
+def build_piece_index(pieces):
+    # piece hash -> position of the piece in the file
+    if isinstance(pieces, (bytes, bytearray)):
+        view = memoryview(pieces)
+        return {view[i:i + 20].hex(): i // 20 for i in range(0, len(view), 20)}
+    # deal_torrent.py format, piece i is stored as ".../piece_{i}.bin"
+    piece_index = {}
+    for piece_hash, piece_path in pieces.items():
+        name = os.path.basename(piece_path.decode().replace('\\', '/'))
+        piece_index[piece_hash.decode()] = int(name[len('piece_'):-len('.bin')])
+    return piece_index
+
 ###############################################
 ## connect tracker
-def upload_hash_list_TO_TRACKER(tracker_socket):
-    try:
-        response = tracker_socket.recv(BUFFER_SIZE).decode()
-        if response == "REQUEST_HASH_LIST":
-            with hash_dict_lock:
-                list_piece = [piece for piece, bitfield in HASH_DICT.items() if bitfield == 1]
-                length = len(list_piece)
-                if list_piece:
-                    data = json.dumps(list_piece).encode()
-                    logging.info(f"Sending list of {length} pieces to tracker.")
-                else:
-                    data = "BLANK".encode()
-                    logging.info("Sending 'BLANK' list to tracker.")
-                send_msg(tracker_socket, data)
-        else:
-            logging.warning(f"Unexpected response from tracker while uploading hash_dict: {response}")
-    except Exception as e:
-        logging.error(f"Unexpected error while uploading hash_dict to tracker: {e}") 
+def decompress_reply(data):
+    # first byte tells how the tracker compressed the rest, R for not at all
+    flag, body = data[:1], memoryview(data)[1:]
+    if flag == b"R":
+        return body
+    for codec_flag, decompress in DECOMPRESSORS.values():
+        if flag == codec_flag:
+            return decompress(body)
+    raise struct.error(f"unknown compression flag {flag!r}")
+
+def unpack_peer_dict(data):
+    # tracker wire format, for every peer: >H address length, the address,
+    # >I hash count, then the raw 20-byte SHA-1 hashes
+    peer_dict = {}
+    view = memoryview(data)
+    offset = 0
+    while offset < len(view):
+        (addr_length,) = struct.unpack_from('>H', view, offset)
+        offset += 2
+        addr = bytes(view[offset:offset + addr_length]).decode()
+        offset += addr_length
+        (count,) = struct.unpack_from('>I', view, offset)
+        offset += 4
+        end = offset + count * 20
+        if end > len(view):
+            raise struct.error(f"truncated hash list of {addr}")
+        hex_hashes = view[offset:end].hex()
+        peer_dict[addr] = [hex_hashes[i:i + 40] for i in range(0, len(hex_hashes), 40)]
+        offset = end
+    return peer_dict
+
+def cached_hash_list():
+    # Serialized list of downloaded pieces, rebuilt only after BITFIELD gained a piece
+    global HASH_LIST_CACHE, HASH_LIST_LENGTH, HASH_LIST_DIRTY
+    with bitfield_lock:
+        if HASH_LIST_DIRTY or HASH_LIST_CACHE is None:
+            list_piece = [piece for piece, index in PIECE_INDEX.items() if BITFIELD[index]]
+            HASH_LIST_LENGTH = len(list_piece)
+            HASH_LIST_CACHE = bytes.fromhex(''.join(list_piece))
+            HASH_LIST_DIRTY = False
+        return HASH_LIST_CACHE, HASH_LIST_LENGTH
 
 def update_new_piece_TO_TRACKER(this_ip, this_port, tracker_URL, piece):
-    tracker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Sent in batches by tracker_update_worker
+    TRACKER_UPDATE_QUEUE.put(piece)
+    if UPLOAD_PIECE_TO_TRACKER_DEBUG:
+        logging.debug(f"Queue new downloaded piece {piece} for tracker update.")
+
+def next_tracker_update_batch():
+    # Block for the first piece, then gather more until the batch is full or the flush interval ends
     try:
-        tracker_socket.connect((tracker_URL.split(':')[0], int(tracker_URL.split(':')[1])))
-        tracker_socket.send(f"UPDATE_PIECE {this_ip} {this_port} {piece}".encode())
-        if UPLOAD_PIECE_TO_TRACKER_DEBUG:
-            logging.debug(f"UPDATE new downloaded piece {piece} to tracker.")
+        batch = [TRACKER_UPDATE_QUEUE.get(timeout=1)]
+    except queue.Empty:
+        return []
+    deadline = time.monotonic() + TRACKER_UPDATE_FLUSH_INTERVAL
+    while len(batch) < TRACKER_UPDATE_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(TRACKER_UPDATE_QUEUE.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
 
-    except socket.timeout:
-        logging.error(f"Timeout error while connecting to tracker {tracker_URL}")
-        return None
-    except socket.error as e:
-        logging.error(f"Socket error occurred during registration: {e}")
-        return None
-    except Exception as e:
-        logging.error(f"Unexpected error during registration: {e}")
-        return None
-    finally:
+def tracker_update_worker(this_ip, this_port, tracker_URL):
+    # One long-lived tracker connection carrying every UPDATE_PIECES message
+    tracker_socket = None
+    batch = []
+    while PROGRAM_IS_RUNNING:
+        if not batch:
+            batch = next_tracker_update_batch()
+            if not batch:
+                continue
+        try:
+            if tracker_socket is None:
+                tracker_socket = new_tcp_socket()
+                tracker_socket.connect((tracker_URL.split(':')[0], int(tracker_URL.split(':')[1])))
+            if len(batch) == 1:
+                msg = UPDATE_PIECE_FRAME.pack(OP_UPDATE_PIECE, int(this_port), bytes.fromhex(batch[0]))
+            else:
+                msg = PORT_FRAME.pack(OP_UPDATE_PIECES, int(this_port)) + bytes.fromhex(''.join(batch))
+            # Framed like send_msg, but errors must reach us to reconnect
+            tracker_socket.sendall(struct.pack('>I', len(msg)) + msg)
+            if UPLOAD_PIECE_TO_TRACKER_DEBUG:
+                logging.debug(f"UPDATE {len(batch)} new downloaded pieces to tracker.")
+        except socket.timeout:
+            logging.error(f"Timeout error while connecting to tracker {tracker_URL}")
+        except socket.error as e:
+            logging.error(f"Socket error occurred during piece update: {e}")
+        except Exception as e:
+            logging.error(f"Unexpected error during piece update: {e}")
+        else:
+            batch = []
+            continue
+        # Reconnect and resend the same batch, its pieces are no longer in the queue
+        if tracker_socket is not None:
+            tracker_socket.close()
+            tracker_socket = None
+        time.sleep(TRACKER_UPDATE_RETRY_DELAY)
+    if tracker_socket is not None:
         tracker_socket.close()
-        #logging.debug(f"Closing connection with tracker after update piece.")
 
 def register_peer(this_ip, this_port, tracker_URL):
-    tracker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tracker_socket = new_tcp_socket()
     try:
         tracker_socket.connect((tracker_URL.split(':')[0], int(tracker_URL.split(':')[1])))
-        tracker_socket.send(f"REGISTER {this_ip} {this_port}".encode())
-        response = tracker_socket.recv(BUFFER_SIZE).decode().split(":")
+        # The hash list rides along with REGISTER, the tracker answers once
+        data, length = cached_hash_list()
+        logging.info(f"Registering with a list of {length} pieces.")
+        send_msg(tracker_socket, REGISTER_FRAME.pack(OP_REGISTER, int(this_port), length) + data)
+        response = recv_text(tracker_socket).split(":")
         logging.info(response[0])
         this_addr = f'{response[1]}:{response[2]}'
-        tracker_socket.send("DONE".encode())
-        upload_hash_list_TO_TRACKER(tracker_socket)
         return this_addr
 
     except socket.timeout:
@@ -246,11 +490,11 @@ def register_peer(this_ip, this_port, tracker_URL):
 
 def unregister(this_ip, this_port, tracker_URL):
 
-    tracker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    tracker_socket = new_tcp_socket()
     try:
         tracker_socket.connect((tracker_URL.split(':')[0], int(tracker_URL.split(':')[1])))
-        tracker_socket.send(f"UNREGISTER {this_ip} {this_port}".encode())
-        response = tracker_socket.recv(BUFFER_SIZE).decode()
+        send_msg(tracker_socket, PORT_FRAME.pack(OP_UNREGISTER, int(this_port)))
+        response = recv_text(tracker_socket)
         logging.info(response)
     except socket.timeout:
         logging.error(f"Timeout error while unregistering with tracker {tracker_URL}")
@@ -264,49 +508,49 @@ def unregister(this_ip, this_port, tracker_URL):
 
 ###############################################
 ## handle connect from leecher
-def unchoke_for_peer(peer_ip, requested_socket):
-    try:  
-        while True:  
-            if peer_ip in UNCHOKE:
-                requested_socket.send("UNCHOKED".encode())
-                if CHOKE_DEBUG:
-                    logging.debug(f"Unchoke for {peer_ip}")
-                break
-    except socket.error as e:
-        logging.error(f"Socket error during communication with peer: {e}")
-    except Exception as e:
-        logging.error(f"Unexpected error while handling leecher 2: {e}")
+def unchoke_event(peer_addr):
+    with unchoke_events_lock:
+        return UNCHOKE_EVENTS[peer_addr]
+
+def wait_for_unchoke(peer_addr):
+    event = unchoke_event(peer_addr)
+    while not event.wait(timeout=1):
+        if not PROGRAM_IS_RUNNING:
+            return False
+    return True
         
 def handle_leecher(requested_socket, peer_ip, peer_port):
     try:
         peer_addr = f"{peer_ip}:{peer_port}"
         if peer_addr not in UNCHOKE:
-            requested_socket.send("CHOKED".encode())
+            send_text(requested_socket, "CHOKED")
             if CHOKE_DEBUG:
                 logging.debug(f"Choke {peer_addr}")
-            while True:
-                if peer_addr in UNCHOKE:
-                    break
+            if not wait_for_unchoke(peer_addr):
+                return
             if CHOKE_DEBUG:
                 logging.debug(f"Unchoke for {peer_ip}:{peer_port}")
-            requested_socket.send("UNCHOKED".encode())
+            send_text(requested_socket, "UNCHOKED")
         else:
-            requested_socket.send("NO_CHOKED".encode())
+            send_text(requested_socket, "NO_CHOKED")
         while PROGRAM_IS_RUNNING:
-            request = requested_socket.recv(BUFFER_SIZE).decode()       
+            request = recv_text(requested_socket)
             if not request:
                 break
             if request.startswith("REQUEST_PIECE"):
                 piece_hash = request.split()[1]
-                piece_file_path = f'list_pieces/{piece_hash}.bin'
-                file_data = load_file(piece_file_path)
-                total_sent = len(file_data) 
                 try:
-                    send_msg(requested_socket, file_data)
+                    if SENDFILE_UPLOAD:
+                        total_sent = send_piece_file(requested_socket, piece_hash)
+                    else:
+                        file_data = load_piece(piece_hash)
+                        total_sent = len(file_data)
+                        send_msg(requested_socket, file_data)
                     if UPLOAD_DEBUG:
                         logging.debug(f"Sent {total_sent} bytes of piece {piece_hash} to {peer_ip}:{peer_port}")
-                except Exception as e:
-                    logging.error(f"Unexpected error while sending data: {e}")
+                except FileNotFoundError:
+                    logging.error(f"Requested piece {piece_hash} not found!")
+                    break
     except socket.error as e:
         logging.error(f"Socket error during communication with peer: {e}")
     except Exception as e:
@@ -314,6 +558,27 @@ def handle_leecher(requested_socket, peer_ip, peer_port):
     finally:
         #logging.info(f"Closing connection with {peer_ip}.")
         requested_socket.close()
+def accept_pending(server):
+    # Accept every queued connection of a non-blocking server socket
+    while True:
+        try:
+            yield server.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+
+def greet_leecher(requested_socket, peer_ip):
+    # Read the peer's "ip:port" on the worker so a slow peer can't stall accept
+    try:
+        peer_addr = recv_text(requested_socket).split(":")
+        peer_port = peer_addr[1]
+    except Exception as e:
+        logging.error(f"Error while accepting connection: {e}")
+        requested_socket.close()
+        return
+    logging.info(f"Connection from {peer_addr}")
+    choke_algorithm(peer_ip, peer_port)
+    handle_leecher(requested_socket, peer_ip, peer_port)
+
 def you_are_listening(this_ip, this_port):
     with ThreadPoolExecutor(max_workers=MAX_THREADS_LISTENER) as listener:
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -323,24 +588,28 @@ def you_are_listening(this_ip, this_port):
         listener.submit(choke_periodly)
         listener.submit(unchoke_periodly)
         
-        server.settimeout(10)
+        # Wait for readiness with epoll (or the best selector of the platform)
+        # and accept the whole backlog on each wakeup
+        server.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
         active_socket_list = []
         logging.info(f"You are listening on {this_ip}:{this_port}.")
         try:
             while PROGRAM_IS_RUNNING:
                 try:
-                    requested_socket, addr = server.accept()
-                    active_socket_list.append(requested_socket)                   
-                    peer_addr = requested_socket.recv(BUFFER_SIZE).decode().split(":")
-                    logging.info(f"Connection from {peer_addr}")
-                    choke_algorithm(addr[0], peer_addr[1])
-                    listener.submit(handle_leecher,requested_socket, addr[0], peer_addr[1])                    
-                except socket.timeout:
-                    continue
+                    if not selector.select(timeout=1):
+                        continue
+                    for requested_socket, addr in accept_pending(server):
+                        requested_socket.setblocking(True)
+                        requested_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                        active_socket_list.append(requested_socket)
+                        listener.submit(greet_leecher, requested_socket, addr[0])
                 except Exception as e:
                     logging.error(f"Error while accepting connection: {e}")
                     break
         finally:
+            selector.close()
             logging.info(f"You stop listening on {this_ip}:{this_port}.")
             for socket_ in active_socket_list:
                 try:
@@ -348,13 +617,40 @@ def you_are_listening(this_ip, this_port):
                 except Exception as e:
                     logging.error(f"Error closing client socket: {e}")        
 
+def push_choked(peer_addr):
+    # caller holds choke_lock
+    if peer_addr not in CHOKED_SET:
+        CHOKED_SET.add(peer_addr)
+        CHOKED_QUEUE.append(peer_addr)
+        CHOKED_PEERS.set()
+
+def add_unchoked(peer_addr):
+    # caller holds choke_lock
+    UNCHOKE.add(peer_addr)
+    unchoke_event(peer_addr).set()
+    UNCHOKED_PEERS.set()
+
+def pop_choked():
+    # caller holds choke_lock
+    if not CHOKED_QUEUE:
+        return None
+    peer_addr = CHOKED_QUEUE.popleft()
+    CHOKED_SET.discard(peer_addr)
+    return peer_addr
+
+def remove_choked(peer_addr):
+    # caller holds choke_lock
+    if peer_addr in CHOKED_SET:
+        CHOKED_SET.discard(peer_addr)
+        CHOKED_QUEUE.remove(peer_addr)
+
 def choke_algorithm(peer_ip, peer_port):
     global DOWNLOAD_RATE_DICT, CHOKED_QUEUE, UNCHOKE
     peer_addr = f"{peer_ip}:{peer_port}"
     if peer_addr not in UNCHOKE:
         with choke_lock:
-            if peer_addr not in list(CHOKED_QUEUE.queue):  # Lấy tất cả phần tử trong hàng đợi để kiểm tra
-                UNCHOKE.append(peer_addr)
+            if peer_addr not in CHOKED_SET:
+                add_unchoked(peer_addr)
                 if CHOKE_DEBUG:
                     logging.debug(f"Unchoke for new peer: {peer_addr}")
             '''
@@ -377,53 +673,65 @@ def choke_algorithm(peer_ip, peer_port):
         '''
 
 def unchoke_for(peer_addr):
-
+    with choke_lock:
         if peer_addr not in UNCHOKE:
-            if peer_addr in CHOKED_QUEUE.queue:  
-                CHOKED_QUEUE.queue.remove(peer_addr)
-            UNCHOKE.append(peer_addr)
+            remove_choked(peer_addr)
+            add_unchoked(peer_addr)
 
 def unchoke_periodly():
     global UNCHOKE
     interval = UNCHOKE_INTERVAL  #
     while PROGRAM_IS_RUNNING:
-            time.sleep(interval)
+            # idle until some peer is choked, then unchoke one every interval
+            CHOKED_PEERS.wait()
+            if SHUTDOWN_EVENT.wait(interval) or not PROGRAM_IS_RUNNING:
+                break
             logging.debug("==================== UNCHOKE PERIODLY ====================")
-            if not CHOKED_QUEUE.empty():
-                unchoked_ip = CHOKED_QUEUE.get()
-                UNCHOKE.append(unchoked_ip)
-                if CHOKE_DEBUG:
-                    logging.debug(f"Unchoke for: {unchoked_ip}")
-                if SEEDER:
-                    unchoked_ip = CHOKED_QUEUE.get()
-                    UNCHOKE.append(unchoked_ip)
+            with choke_lock:
+                unchoked_ip = pop_choked()
+                if unchoked_ip:
+                    add_unchoked(unchoked_ip)
                     if CHOKE_DEBUG:
-                        logging.debug(f"Unchoke for: {unchoked_ip} (seeder mode)")
-            if CHOKE_DEBUG:
-                logging.debug(f"List UN_CHOKED:")
-                for peer_addr in UNCHOKE:
-                    logging.debug(f"{peer_addr}")
-        # base on weight of network
-            interval = max(UNCHOKE_INTERVAL, min(60, len(CHOKED_QUEUE.queue) // 2))
+                        logging.debug(f"Unchoke for: {unchoked_ip}")
+                    if SEEDER:
+                        unchoked_ip = pop_choked()
+                        if unchoked_ip:
+                            add_unchoked(unchoked_ip)
+                            if CHOKE_DEBUG:
+                                logging.debug(f"Unchoke for: {unchoked_ip} (seeder mode)")
+                if not CHOKED_QUEUE:
+                    CHOKED_PEERS.clear()
+                if CHOKE_DEBUG:
+                    logging.debug(f"List UN_CHOKED:")
+                    for peer_addr in UNCHOKE:
+                        logging.debug(f"{peer_addr}")
+            # base on weight of network
+                interval = max(UNCHOKE_INTERVAL, min(60, len(CHOKED_QUEUE) // 2))
 
 def choke_periodly():
     while PROGRAM_IS_RUNNING and not SEEDER:
-        time.sleep(4)
+        # idle while nobody is unchoked
+        UNCHOKED_PEERS.wait()
+        if SHUTDOWN_EVENT.wait(CHOKE_INTERVAL) or not PROGRAM_IS_RUNNING:
+            break
         with choke_lock:
-            for peer_addr in UNCHOKE:
+            for peer_addr in list(UNCHOKE):
                 if peer_addr not in TOTAL_DOWNLOADED or TOTAL_DOWNLOADED[peer_addr] < 512 * 1024:
                     UNCHOKE.remove(peer_addr)
-                    CHOKED_QUEUE.put(peer_addr)
+                    unchoke_event(peer_addr).clear()
+                    push_choked(peer_addr)
                     if CHOKE_DEBUG:
                         logging.debug(f"Apply penalty to {peer_addr} due to no uploading data.")
+            if not UNCHOKE:
+                UNCHOKED_PEERS.clear()
 
 
 ###############################################
 ## connect seeder
 def start_download_piece(seeder_socket, piece, seeder_ip, seeder_port):
+    global HASH_LIST_DIRTY
     try:
-        request = f"REQUEST_PIECE {piece}".encode()
-        seeder_socket.send(request)
+        send_text(seeder_socket, f"REQUEST_PIECE {piece}")
 
         # Tính toán tốc độ tải xuống
         total_bytes_downloaded = 0
@@ -432,9 +740,6 @@ def start_download_piece(seeder_socket, piece, seeder_ip, seeder_port):
         file_data = recv_msg(seeder_socket)
         if file_data:
             total_bytes_downloaded = len(file_data)
-            with file_lock:
-                with open(f'list_pieces/{piece}.bin', 'wb') as f:
-                    f.write(file_data)
         else:
             logging.warning("No data received from the server.")
               
@@ -449,37 +754,34 @@ def start_download_piece(seeder_socket, piece, seeder_ip, seeder_port):
             else:
                 TOTAL_DOWNLOADED[seeder_addr] = (TOTAL_DOWNLOADED[seeder_addr] + total_bytes_downloaded)
 
-        #check hash
+        #check hash on the received buffer, only verified pieces reach the disk
+        if file_data:
             try:
-                piece_path = f'list_pieces/{piece}.bin'
-                piece_data = load_file(piece_path)
-                piece_hash_test = hashlib.sha1(piece_data).hexdigest()
+                piece_hash_test = sha1_hex(file_data)
                 if piece_hash_test == piece:
+                    # written straight to its place in the output file, no merge pass needed
+                    os.pwrite(OUTPUT_FILE.fileno(), file_data, output_region(piece)[0])
                     if DOWNLOAD_DEBUG:
                         logging.debug(f"Received piece {piece} from {seeder_ip}:{seeder_port}")
-                    with hash_dict_lock:
-                        HASH_DICT[piece] = 1
+                    with bitfield_lock:
+                        BITFIELD[PIECE_INDEX[piece]] = 1
+                        HASH_LIST_DIRTY = True
                     update_downloaded_count_and_print()
                     update_new_piece_TO_TRACKER(this_ip, this_port, tracker_URL, piece)
                 else:
                     logging.error(f"Error! Expected: {piece}, but received: {piece_hash_test}")
-                    os.remove(f'list_pieces/{piece}.bin')
-                    with hash_dict_lock:
-                        HASH_DICT[piece] = 0     
+                    with bitfield_lock:
+                        BITFIELD[PIECE_INDEX[piece]] = 0     
             except Exception as e: 
                 logging.error(f"Unexpected Error in checking hash: {e}")
     except socket.error as e:
         logging.error(f"Disconnection with {seeder_ip}:{seeder_port}: {e}")
-        if os.path.exists(f'list_pieces/{piece}.bin'):
-            os.remove(f'list_pieces/{piece}.bin')
-        with hash_dict_lock:
-            HASH_DICT[piece] = 0
+        with bitfield_lock:
+            BITFIELD[PIECE_INDEX[piece]] = 0
     except Exception as e:
         logging.error(f"Unexpected Error during receive data for piece {piece}: {e}")
-        if os.path.exists(f'list_pieces/{piece}.bin'):
-            os.remove(f'list_pieces/{piece}.bin')
-        with hash_dict_lock:
-            HASH_DICT[piece] = 0
+        with bitfield_lock:
+            BITFIELD[PIECE_INDEX[piece]] = 0
     return total_bytes_downloaded
            
 def request_pieces_from_peer(this_addr,peer_addr, list_pieces):
@@ -488,16 +790,16 @@ def request_pieces_from_peer(this_addr,peer_addr, list_pieces):
     peer_ip = peer_info[0]
     peer_port = int(peer_info[1])
     total_bytes_downloaded = 0
-    send_request_pieces_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    send_request_pieces_socket = new_tcp_socket()
     try:
         send_request_pieces_socket.connect((peer_ip, peer_port))
         logging.info(f"Connect to {peer_ip}:{peer_port} for downloading. Port used: {send_request_pieces_socket.getsockname()[1]}")
         send_request_pieces_socket.settimeout(10)
-        send_request_pieces_socket.send(this_addr.encode())
-        command = send_request_pieces_socket.recv(BUFFER_SIZE).decode()
+        send_text(send_request_pieces_socket, this_addr)
+        command = recv_text(send_request_pieces_socket)
         if command == "CHOKED":
             logging.debug(f"CHOKED by {peer_ip}:{peer_port}")
-            command = send_request_pieces_socket.recv(BUFFER_SIZE)
+            command = recv_text(send_request_pieces_socket)
         if command == "UNCHOKED" or command == "NO_CHOKED":
             logging.info(f"{command} from {peer_ip}:{peer_port}")
             downloaded_pieces = set()
@@ -507,9 +809,9 @@ def request_pieces_from_peer(this_addr,peer_addr, list_pieces):
                 interval = time.time() - start_time
                 if interval > INTERVAL_CYCLE:
                     remaining_pieces = set(list_pieces) - downloaded_pieces
-                    with hash_dict_lock:
+                    with bitfield_lock:
                         for remaining_piece in remaining_pieces:
-                            HASH_DICT[remaining_piece] = 0
+                            BITFIELD[PIECE_INDEX[remaining_piece]] = 0
                     break
             
     except socket.timeout as e:
@@ -535,22 +837,21 @@ def request_pieces_from_peer(this_addr,peer_addr, list_pieces):
 ###############################################
 # distrubute #run
 def distribute_request_to_threads(list_pieces,this_ip, this_port, tracker_URL):
-    global PEER_DICT,HASH_DICT, PIECES_DOWNLOADED_COUNT
+    global PEER_DICT, PIECES_DOWNLOADED_COUNT
     
     peer_and_piece = []
 
-    for piece in list_pieces:
-        with peer_dict_lock:
-            peer_list = [peer for peer, pieces in PEER_DICT.items() if piece in pieces]
+    with peer_dict_lock:
+        piece_to_peers = PIECE_TO_PEERS
 
-        with download_rate_dict_lock:
-            peer_list_sorted = sorted(peer_list, key=lambda x: DOWNLOAD_RATE_DICT.get(x, 0), reverse=True)
+    for piece in list_pieces:
+        # Peers are already ranked by download rate when the index is built
+        peers = piece_to_peers.get(piece, ())
         # Choose the peer with the random top 2 highest download speed
-        if peer_list_sorted:
-            #with hash_dict_lock:
-                #HASH_DICT[piece] = -1  # Mark as downloading
-            top_peers = random.sample(peer_list_sorted, min(2, len(peer_list_sorted)))                
-            best_peer = top_peers[0] 
+        if peers:
+            #with bitfield_lock:
+                #BITFIELD[PIECE_INDEX[piece]] = -1  # Mark as downloading
+            best_peer = random.choice(peers[:2])
             peer_and_piece.append((best_peer, piece))
     
     #  dict với key là peer và value là list các pieces cần request
@@ -561,20 +862,17 @@ def distribute_request_to_threads(list_pieces,this_ip, this_port, tracker_URL):
     if DISTRIBUTE_DEBUG:
         logging.debug(f"SELECTED PEERS: {debug_list_peer}")
     # DISTRIBUTE
-    threads = []
+    this_addr = f"{this_ip}:{this_port}"
+    futures = []
     for peer_addr, pieces in request_dict.items():
         unchoke_for(peer_addr)
         if CHOKE_DEBUG:
             logging.debug(f"Unchoke for {peer_addr} because INTERESTING in list pieces.")
-        this_addr = f"{this_ip}:{this_port}"
         print(this_addr)
-        thread = threading.Thread(target=request_pieces_from_peer, args=(this_addr,peer_addr, pieces))
-        threads.append(thread)
-        thread.start()
+        futures.append(DOWNLOAD_POOL.submit(request_pieces_from_peer, this_addr, peer_addr, pieces))
 
-    # Đợi tất cả threads hoàn thành
-    for thread in threads:
-        thread.join()
+    # Đợi tất cả request hoàn thành
+    wait(futures)
 
 def rarest_first(RAREST_PIECES,this_ip, this_port, tracker_URL):
     random.shuffle(RAREST_PIECES)
@@ -588,11 +886,12 @@ def random_select(other_pieces, this_ip, this_port, tracker_URL):
     distribute_request_to_threads(other_pieces, this_ip, this_port, tracker_URL)
 
 def run(this_ip, this_port, tracker_URL):
-    global PIECES_DOWNLOADED_COUNT, HASH_DICT_AVAILABLE_COUNT,  DOWNLOAD_RATE_DICT, PEER_DICT, END_GAME_MODE, SEEDER
+    global PIECES_DOWNLOADED_COUNT, HASH_DICT_AVAILABLE_COUNT,  DOWNLOAD_RATE_DICT, PEER_DICT, PIECE_TO_PEERS, END_GAME_MODE, SEEDER
 
     this_addr = f'{this_ip}:{this_port}'
     if PIECES_COUNT == PIECES_DOWNLOADED_COUNT:
         logging.info("You have already FINISHED downloading!")
+        write_listed_pieces()
         SEEDER = True
         logging.info("==================== SEEDER MODE ====================")
         return
@@ -600,11 +899,14 @@ def run(this_ip, this_port, tracker_URL):
         SEEDER = False
         logging.info("Searching peer...")
            
-
+    # one tracker connection carries the GET_PEERS_DICT of every cycle
+    tracker_socket = None
     while PROGRAM_IS_RUNNING:
         if PIECES_COUNT == PIECES_DOWNLOADED_COUNT:
             print("You have FINISHED downloading!")
-            merge(FILE_NAME, METAINFO_PATH)
+            if tracker_socket is not None:
+                tracker_socket.close()
+            write_listed_pieces()
             SEEDER = True
             logging.info("==================== SEEDER MODE ====================")
             return
@@ -613,20 +915,23 @@ def run(this_ip, this_port, tracker_URL):
         RAREST_PIECES = []
         OTHER_PIECES = []
         with hash_dict_vailable_count_lock:
-            HASH_DICT_AVAILABLE_COUNT = {key: 0 for key in HASH_DICT_AVAILABLE_COUNT}
+            HASH_DICT_AVAILABLE_COUNT = dict.fromkeys(HASH_DICT_AVAILABLE_COUNT, 0)
 
-        tracker_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            tracker_socket.connect((tracker_URL.split(':')[0], int(tracker_URL.split(':')[1])))
-            tracker_socket.send("GET_PEERS_DICT".encode())
-            dict = recv_msg(tracker_socket)
+            if tracker_socket is None:
+                tracker_socket = new_tcp_socket()
+                tracker_socket.connect((tracker_URL.split(':')[0], int(tracker_URL.split(':')[1])))
+            send_msg(tracker_socket, bytes([OP_GET_PEERS_DICT]) + ','.join(DECOMPRESSORS).encode())
+            reply = recv_msg(tracker_socket)
+            if reply is None:
+                raise ConnectionError("tracker closed the connection")
             logging.info("====================NEW CYCLE UPDATE====================")
             logging.info("Connect tracker to GET_PEERS_DICT")
-            if dict == "BLANK":
+            if reply == b"BLANK":
                 continue
             else:
                 with peer_dict_lock:
-                    PEER_DICT = json.loads(dict)
+                    PEER_DICT = unpack_peer_dict(decompress_reply(reply))
                     PEER_DICT.pop(this_addr)
                     with download_rate_dict_lock:
                             try:
@@ -641,19 +946,26 @@ def run(this_ip, this_port, tracker_URL):
                                             DOWNLOAD_RATE_DICT[peer] = 0
                             except Exception as e:
                                 print(e)
+                    # Inverted index piece -> peers, built in download rate order
+                    PIECE_TO_PEERS = defaultdict(list)
                     if PEER_DICT:
-                        for peer, list_pieces in PEER_DICT.items():
-                            for piece in list_pieces:
-                                HASH_DICT_AVAILABLE_COUNT[piece] += 1
+                        with download_rate_dict_lock:
+                            ranked_peers = sorted(PEER_DICT, key=DOWNLOAD_RATE_DICT.__getitem__, reverse=True)
+                        for peer in ranked_peers:
+                            for piece in PEER_DICT[peer]:
+                                PIECE_TO_PEERS[piece].append(peer)
+                        # Counted in C, pieces nobody has stay at 0
+                        available = Counter(chain.from_iterable(PEER_DICT.values()))
+                        HASH_DICT_AVAILABLE_COUNT = {piece: available[piece] for piece in HASH_DICT_AVAILABLE_COUNT}
                     peers_count = len(PEER_DICT)  + 1
                     sorted_hash_dict = sorted(HASH_DICT_AVAILABLE_COUNT.items(), key=lambda x: x[1])
                     threshold = peers_count / 2
                     percent_done = (PIECES_DOWNLOADED_COUNT / PIECES_COUNT) * 100
 
-                    with hash_dict_lock:
+                    with bitfield_lock:
                         rare_found = False
                         for piece, count in sorted_hash_dict:
-                            if HASH_DICT[piece] == 0:
+                            if not BITFIELD[PIECE_INDEX[piece]]:
                                 if count == 0:
                                     ABSENT_PIECES.append(piece)
                                 elif count <= threshold and percent_done <= 0.15:
@@ -664,17 +976,19 @@ def run(this_ip, this_port, tracker_URL):
             if ABSENT_PIECES:
                 logging.info(f"Absent {len(ABSENT_PIECES)} pieces")
 
-        except socket.timeout:
-            logging.error(f"Timeout error while connecting to tracker {tracker_URL}")
-        except socket.error as e:
-            logging.error(f"Socket error occurred during get peer dict: {e}")
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse JSON data: {e}. Data error: {dict}")
+        except (struct.error, UnicodeDecodeError, zlib.error) as e:
+            logging.error(f"Failed to parse peer dict: {e}")
         except Exception as e:
-            logging.error(f"Unexpected error during get peer dict: {e}") 
-        finally:
-            #logging.info("Closing connection with tracker.")
-            tracker_socket.close()
+            if isinstance(e, socket.timeout):
+                logging.error(f"Timeout error while connecting to tracker {tracker_URL}")
+            elif isinstance(e, socket.error):
+                logging.error(f"Socket error occurred during get peer dict: {e}")
+            else:
+                logging.error(f"Unexpected error during get peer dict: {e}") 
+            # reconnect on the next cycle
+            if tracker_socket is not None:
+                tracker_socket.close()
+                tracker_socket = None
         if RAREST_PIECES:
             logging.info(f"RAREST FIRST || downloaded {percent_done:.2f}%")
             rarest_first(RAREST_PIECES,this_ip, this_port, tracker_URL)
@@ -685,6 +999,8 @@ def run(this_ip, this_port, tracker_URL):
             logging.info(f"RANDOM SELECT || downloaded {percent_done:.2f}%")
             random_select(OTHER_PIECES, this_ip, this_port, tracker_URL) 
         time.sleep(3)
+    if tracker_socket is not None:
+        tracker_socket.close()
     
 
 if __name__ == '__main__':
@@ -695,12 +1011,18 @@ if __name__ == '__main__':
         port_str = file.read().strip()  # Đọc nội dung file và loại bỏ khoảng trắng
         this_port = int(port_str)  # Chuyển đổi chuỗi thành số nguyên
 
-    HASH_DICT, tracker_URL, FILE_NAME, piece_length, pieces, file_length, PIECES_COUNT = read_torrent_file(METAINFO_PATH)
-    HASH_DICT_AVAILABLE_COUNT = HASH_DICT.copy()
+    HASH_DICT_AVAILABLE_COUNT, tracker_URL, FILE_NAME, PIECE_LENGTH, pieces, FILE_LENGTH, PIECES_COUNT = read_torrent_file(METAINFO_PATH)
+    PIECE_INDEX = build_piece_index(pieces)
+    BITFIELD = bytearray(PIECES_COUNT)
 
     if not os.path.exists('list_pieces'):
         os.makedirs('list_pieces')
     check_existing_pieces()
+    if PIECES_DOWNLOADED_COUNT < PIECES_COUNT:
+        resume = os.path.exists(FILE_NAME)
+        OUTPUT_FILE = open_output_file(FILE_NAME, FILE_LENGTH)
+        if resume:
+            check_output_pieces()
     
     this_addr = register_peer(this_ip, this_port, tracker_URL).split(":")
     if this_addr == None:
@@ -708,13 +1030,15 @@ if __name__ == '__main__':
     
     this_ip = this_addr[0]
 
-    threading.Thread(target=check_for_exit, args=(this_ip, this_port, tracker_URL)  ,daemon=True).start()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop(this_ip, this_port, tracker_URL))
+    threading.Thread(target=tracker_update_worker, args=(this_ip, this_port, tracker_URL), daemon=True).start()
 
     with ThreadPoolExecutor(max_workers=2) as ex:
         if not RIDER:    
             ex.submit(you_are_listening, this_ip, this_port) 
         ex.submit(run, this_ip, this_port, tracker_URL)
-    
-    while True:
-        pass
+
+    # Sleep until stop() runs, instead of spinning a core
+    SHUTDOWN_EVENT.wait()
     
\ No newline at end of file
@@ -1,8 +1,13 @@
 import socket
 import threading
+import asyncio
 import json
 import struct
-from concurrent.futures import ThreadPoolExecutor
+import queue
+import sys
+import zlib
+import functools
+from collections import defaultdict
 import logging
 
 with open("config_tracker.json", 'r') as f:
@@ -22,139 +27,461 @@ logging.basicConfig(
     ]
 )
 
-BUFFER_SIZE = 1024
-PEER_and_LIST_PIECES = {}
+RECV_BUFFER_SIZE = 65536 # initial per-connection receive buffer, grows for bigger messages
+READ_SIZE_START = 256 # bytes asked per recv, adapted per connection between the two bounds below
+READ_SIZE_MIN = 128
+READ_SIZE_MAX = 65536
+# Python doesn't export TCP_INQ, its value is 36 on Linux >= 4.18
+TCP_INQ = getattr(socket, "TCP_INQ", 36 if sys.platform.startswith("linux") else None)
+INQ_CMSG_SPACE = socket.CMSG_SPACE(4) if hasattr(socket, "CMSG_SPACE") else 0
+BUFFER_POOL = queue.SimpleQueue() # (bytearray, memoryview) pairs free for the next connection
 
-data_lock = threading.Lock()
+HASH_SIZE = 20 # bytes of a SHA-1 piece hash on the wire
 
-def send_msg(sock, msg):
+# Commands are binary frames: a one byte opcode, then the peer port for all
+# but GET_PEERS_DICT. REGISTER adds a >I hash count, and REGISTER and
+# UPDATE_PIECE(S) carry raw digests after that.
+OP_REGISTER = 1
+OP_UPDATE_PIECE = 2
+OP_GET_PEERS_DICT = 3
+OP_UNREGISTER = 4
+OP_UPDATE_PIECES = 5
+PORT_FRAME = struct.Struct('>BH')
+UPDATE_PIECE_FRAME = struct.Struct(f'>BH{HASH_SIZE}s')
+REGISTER_FRAME = struct.Struct('>BHI')
+
+# GET_PEERS_DICT compression, the client lists the codecs it accepts.
+# Compressors are only called under peers_dict_cache_lock.
+COMPRESSORS = {"zlib": functools.partial(zlib.compress, level=1)}
+try:
+    import zstandard
+    COMPRESSORS["zstd"] = zstandard.ZstdCompressor(level=1).compress
+except ImportError:
+    pass
+CODEC_FLAGS = {"zstd": b"Z", "zlib": b"D"} # b"R" marks an uncompressed reply
+COMPRESS_MIN_SIZE = 1024 # smaller replies are sent as is
+
+try:
+    import uvloop
+    new_event_loop = uvloop.new_event_loop
+except ImportError:
+    new_event_loop = asyncio.new_event_loop
+LISTEN_BACKLOG = 100
+ACCEPT_THREADS = 2 # listening sockets sharing the port with SO_REUSEPORT, one event loop thread each
+SOCKET_BUFFER_SIZE = 256 * 1024 # SO_RCVBUF/SO_SNDBUF, fits a large GET_PEERS_DICT reply
+
+# Peer address -> list of raw piece digests, striped over SHARD_COUNT dicts so
+# the event loop threads don't contend on a single lock. Critical sections
+# never await, so plain thread locks are enough. Lists are append-only,
+# updates append in place and registration rebinds the entry, so a snapshot
+# only records each list with its current length under the lock. The prefix
+# it covers never changes, so it is copied and serialized after the lock is
+# released.
+SHARD_COUNT = 32 # power of two
+SHARDS = [(threading.Lock(), {}) for _ in range(SHARD_COUNT)]
+
+# Peer ip -> registered addresses on that ip, so a dropped connection
+# finds its peers without scanning every shard
+IP_INDEX = defaultdict(set)
+ip_index_lock = threading.Lock()
+
+# Encoded GET_PEERS_DICT reply, rebuilt only after the shards changed
+PEERS_DICT_CACHE = None
+PEERS_DICT_DIRTY = True
+PEERS_DICT_COMPRESSED = {} # codec -> flagged compressed reply, for the current PEERS_DICT_CACHE
+peers_dict_cache_lock = threading.Lock()
+
+async def wait_readable(sock):
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(sock.fileno(), lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(sock.fileno())
+
+async def wait_writable(sock):
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_writer(sock.fileno(), lambda: ready.done() or ready.set_result(None))
     try:
-        msg = struct.pack('>I', len(msg)) + msg
-        sock.sendall(msg)
+        await ready
+    finally:
+        loop.remove_writer(sock.fileno())
+
+async def send_msg(sock, msg):
+    try:
+        # Header and body go out as one gathered write, the body is never copied
+        buffers = [struct.pack('>I', len(msg)), memoryview(msg)]
+        remaining = 4 + len(msg)
+        while remaining:
+            try:
+                sent = sock.sendmsg(buffers)
+            except (BlockingIOError, InterruptedError):
+                await wait_writable(sock)
+                continue
+            remaining -= sent
+            # Short write, skip what the kernel already took and send the rest
+            while remaining and sent >= len(buffers[0]):
+                sent -= len(buffers.pop(0))
+            if remaining and sent:
+                buffers[0] = memoryview(buffers[0])[sent:]
     except Exception as e:
         logging.error(f"Error sending message: {e}")
 
-def recv_msg(sock):
+def get_buf():
+    # Receive buffers are reused across connections instead of allocated per connection
     try:
-        raw_msglen = recvall(sock, 4)
-        if not raw_msglen:
-            return None
-        msglen = struct.unpack('>I', raw_msglen)[0]
-        return recvall(sock, msglen)
-    except Exception as e:
-        logging.error(f"Error receiving message: {e}")
-        return None
-
-def recvall(sock, n):
-    data = bytearray()
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
+        return BUFFER_POOL.get_nowait()
+    except queue.Empty:
+        buf = bytearray(RECV_BUFFER_SIZE)
+        return buf, memoryview(buf)
+
+def return_buf(buf, view):
+    BUFFER_POOL.put((buf, view))
+
+class FramedReader:
+    # Reads length-prefixed messages of one connection into a reusable buffer.
+    # A single recv_into can bring in the header, the body and the start of the
+    # next message; leftovers stay in the buffer for the next read_message().
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf, self.view = get_buf()
+        self.read_off = 0
+        self.write_off = 0
+        self.read_size = READ_SIZE_START
+        self.small_reads = 0
+        # Bytes the kernel still had queued after the last read (Linux TCP_INQ)
+        self.inq = 0
+        self.use_inq = False
+        if TCP_INQ is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, TCP_INQ, 1)
+                self.use_inq = True
+            except OSError:
+                pass
+
+    def close(self):
+        # Give the buffer back for the next connection, grown buffers are dropped
+        if len(self.buf) == RECV_BUFFER_SIZE:
+            return_buf(self.buf, self.view)
+        self.buf = self.view = None
+
+    async def read_message(self):
+        try:
+            while True:
+                available = self.write_off - self.read_off
+                need = 4
+                if available >= 4:
+                    need += struct.unpack_from('>I', self.buf, self.read_off)[0]
+                    if available >= need:
+                        start = self.read_off + 4
+                        self.read_off += need
+                        return bytes(self.view[start:self.read_off])
+                if self.read_off + need > len(self.buf):
+                    self._make_room(need)
+                # Ask for everything already queued so one recv drains it
+                end = min(self.write_off + max(self.read_size, self.inq), len(self.buf))
+                # Try the read first, only wait on the loop when nothing is queued
+                try:
+                    received = self._recv(self.view[self.write_off:end])
+                except (BlockingIOError, InterruptedError):
+                    await wait_readable(self.sock)
+                    continue
+                if not received:
+                    return None
+                self.write_off += received
+                self._adapt_read_size(received)
+        except Exception as e:
+            logging.error(f"Error receiving message: {e}")
             return None
-        data.extend(packet)
-    return data
-
-def handle_register(client_ip, client_port, client_socket):
-    client_addr = f"{client_ip}:{client_port}"
-    if client_addr not in PEER_and_LIST_PIECES:
-        client_socket.send(f"Registered successfully.:{client_ip}:{client_port}".encode())
-        logging.info(f"Peer registered: {client_addr}")
+
+    def _recv(self, view):
+        if not self.use_inq:
+            return self.sock.recv_into(view)
+        received, ancdata, _, _ = self.sock.recvmsg_into([view], INQ_CMSG_SPACE)
+        self.inq = 0
+        for level, kind, data in ancdata:
+            if level == socket.IPPROTO_TCP and kind == TCP_INQ:
+                self.inq = int.from_bytes(data[:4], sys.byteorder)
+        return received
+
+    def _adapt_read_size(self, received):
+        # MINA's scheme: double after a read that filled the request,
+        # halve after two reads in a row that filled less than half
+        if received >= self.read_size:
+            self.read_size = min(self.read_size * 2, READ_SIZE_MAX)
+            self.small_reads = 0
+        elif received < self.read_size // 2:
+            self.small_reads += 1
+            if self.small_reads == 2:
+                self.read_size = max(self.read_size // 2, READ_SIZE_MIN)
+                self.small_reads = 0
+        else:
+            self.small_reads = 0
+
+    def _make_room(self, need):
+        # Move the unread bytes to the front, growing the buffer for big messages
+        available = self.write_off - self.read_off
+        if need <= len(self.buf):
+            self.buf[:available] = self.view[self.read_off:self.write_off]
+        else:
+            buf = bytearray(max(need, 2 * len(self.buf)))
+            buf[:available] = self.view[self.read_off:self.write_off]
+            self.view.release()
+            self.buf = buf
+            self.view = memoryview(buf)
+        self.read_off = 0
+        self.write_off = available
+
+async def send_text(sock, text):
+    await send_msg(sock, text.encode())
+
+# Wire format of hash lists: raw SHA-1 digests back to back. The peer dict is,
+# for every peer, >H address length, the address, >I hash count, the hashes.
+def unpack_hashes(data):
+    data = bytes(data)
+    return [data[i:i + HASH_SIZE] for i in range(0, len(data), HASH_SIZE)]
+
+def pack_peer_dict(peer_dict):
+    parts = []
+    for addr, hashes in peer_dict.items():
+        addr = addr.encode()
+        parts.append(struct.pack(f'>H{len(addr)}sI', len(addr), addr, len(hashes)))
+        parts.extend(hashes)
+    return b''.join(parts)
+
+def _shard(client_addr):
+    return SHARDS[_shard_index(client_addr)]
+
+def _shard_index(client_addr):
+    return hash(client_addr) & (SHARD_COUNT - 1)
+
+def index_peer(client_ip, client_addr):
+    # caller holds the shard lock of client_addr
+    with ip_index_lock:
+        IP_INDEX[client_ip].add(client_addr)
+
+def unindex_peer(client_ip, client_addr):
+    # caller holds the shard lock of client_addr
+    with ip_index_lock:
+        addrs = IP_INDEX.get(client_ip)
+        if addrs is not None:
+            addrs.discard(client_addr)
+            if not addrs:
+                del IP_INDEX[client_ip]
+
+async def handle_register(client_ip, client_addr, client_socket, data):
+    # The REGISTER frame carries the peer's hash list, one round trip in all
+    list_piece = unpack_hashes(data)
+    lock, peers = _shard(client_addr)
+    with lock:
+        registered = client_addr in peers
+        if not registered:
+            index_peer(client_ip, client_addr)
+        peers[client_addr] = list_piece
+    mark_peers_changed()
+    if not registered:
+        await send_text(client_socket, f"Registered successfully.:{client_addr}")
+        logging.info(f"Peer registered: {client_addr} with {len(list_piece)} pieces")
     else:
-        client_socket.send(f"You have already registered.:{client_ip}:{client_port}".encode())
+        await send_text(client_socket, f"You have already registered.:{client_addr}")
         logging.warning(f"Peer already registered: {client_addr}")
 
-def request_hash_list(client_ip, client_port, client_socket):
-    global PEER_and_LIST_PIECES
-    client_addr = f"{client_ip}:{client_port}"
-    client_socket.send("REQUEST_HASH_LIST".encode())
-    data = recv_msg(client_socket).decode()
-    if data == "BLANK":
-        PEER_and_LIST_PIECES[client_addr] = []
-        logging.info(f"No hash list provided by peer {client_addr}.")
-    else:
-        try:
-            list_piece = json.loads(data)
-            with data_lock:
-                PEER_and_LIST_PIECES[client_addr] = list_piece
-            logging.info(f"Hash list received from peer {client_addr}.")
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse JSON from {client_addr}: {e}")
-
-def handle_update_piece(client_ip, client_port, hash_value, flag):
-    global PEER_and_LIST_PIECES
-    client_addr = f"{client_ip}:{client_port}"
-    with data_lock:
-        if client_addr not in PEER_and_LIST_PIECES:
-            PEER_and_LIST_PIECES[client_addr] = []
-        PEER_and_LIST_PIECES[client_addr].append(hash_value)
-        if DEBUG_UPDATE_PIECE:
-            logging.debug(f"Updated downloaded hash {hash_value} from peer {client_addr}.")
-
-def handle_get_list_peer(client_socket):
-    with data_lock:
-        if PEER_and_LIST_PIECES:
-            data = json.dumps(PEER_and_LIST_PIECES).encode()
-            send_msg(client_socket, data)
-            logging.info("Sent list peers to client.")
+def handle_update_piece(client_ip, client_addr, hash_value, flag):
+    lock, peers = _shard(client_addr)
+    with lock:
+        # O(1) per update, rebuilding the peer's whole hash list made a piece
+        # storm quadratic in the number of pieces the peer holds
+        hashes = peers.get(client_addr)
+        if hashes is None:
+            index_peer(client_ip, client_addr)
+            peers[client_addr] = [hash_value]
         else:
-            blank_data = "BLANK".encode()
-            client_socket.send(blank_data)
-            logging.error("Sent empty peer data to client.")
-
-def handle_unregister(client_ip, client_port, client_socket):
-    global PEER_and_LIST_PIECES
-    client_addr = f"{client_ip}:{client_port}"
-    if client_addr in PEER_and_LIST_PIECES:
-        with data_lock:
-            PEER_and_LIST_PIECES.pop(client_addr, None)
-        client_socket.send(b"Unregistered successfully.")
+            hashes.append(hash_value)
+    mark_peers_changed()
+    if DEBUG_UPDATE_PIECE:
+        logging.debug(f"Updated downloaded hash {hash_value.hex()} from peer {client_addr}.")
+
+def handle_update_pieces(client_ip, client_addr, data):
+    if len(data) % HASH_SIZE:
+        logging.error(f"Malformed piece update from {client_addr}: {len(data)} bytes")
+        return
+    hash_values = unpack_hashes(data)
+    lock, peers = _shard(client_addr)
+    with lock:
+        hashes = peers.get(client_addr)
+        if hashes is None:
+            index_peer(client_ip, client_addr)
+            peers[client_addr] = hash_values
+        else:
+            hashes.extend(hash_values)
+    mark_peers_changed()
+    if DEBUG_UPDATE_PIECE:
+        logging.debug(f"Updated {len(hash_values)} downloaded hashes from peer {client_addr}.")
+
+def mark_peers_changed():
+    # Called after every change to the shards, the next GET_PEERS_DICT re-encodes
+    global PEERS_DICT_DIRTY
+    PEERS_DICT_DIRTY = True
+
+def pick_codec(accepted):
+    # First codec in the client's list that this tracker can compress with
+    for codec in accepted.split(","):
+        if codec in COMPRESSORS:
+            return codec
+    return None
+
+def peers_dict_bytes(codec=None):
+    # Reply is BLANK, or a codec flag byte followed by the packed peer dict
+    global PEERS_DICT_CACHE, PEERS_DICT_DIRTY
+    with peers_dict_cache_lock:
+        if PEERS_DICT_DIRTY or PEERS_DICT_CACHE is None:
+            # Cleared before the snapshot, so a change racing with it marks the cache again
+            PEERS_DICT_DIRTY = False
+            # Snapshot the shards one lock at a time, O(1) per peer under the
+            # lock, then copy the recorded prefixes without holding any
+            snapshot = []
+            for lock, peers in SHARDS:
+                with lock:
+                    snapshot.extend((addr, hashes, len(hashes)) for addr, hashes in peers.items())
+            peer_dict = {addr: hashes[:count] for addr, hashes, count in snapshot}
+            PEERS_DICT_CACHE = pack_peer_dict(peer_dict) if peer_dict else b"BLANK"
+            PEERS_DICT_COMPRESSED.clear()
+        data = PEERS_DICT_CACHE
+        if data == b"BLANK":
+            return data
+        if codec is None or len(data) < COMPRESS_MIN_SIZE:
+            return b"R" + data
+        if codec not in PEERS_DICT_COMPRESSED:
+            # Hashes repeat across peers, so even a fast level shrinks big swarms well
+            compressed = COMPRESSORS[codec](data)
+            if len(compressed) < len(data):
+                PEERS_DICT_COMPRESSED[codec] = CODEC_FLAGS[codec] + compressed
+            else:
+                PEERS_DICT_COMPRESSED[codec] = b"R" + data
+        return PEERS_DICT_COMPRESSED[codec]
+
+async def handle_get_list_peer(client_socket, accepted=""):
+    data = peers_dict_bytes(pick_codec(accepted))
+    await send_msg(client_socket, data)
+    if data != b"BLANK":
+        logging.info("Sent list peers to client.")
+    else:
+        logging.error("Sent empty peer data to client.")
+
+async def handle_unregister(client_ip, client_addr, client_socket):
+    lock, peers = _shard(client_addr)
+    with lock:
+        registered = peers.pop(client_addr, None) is not None
+        if registered:
+            unindex_peer(client_ip, client_addr)
+    if registered:
+        mark_peers_changed()
+        await send_msg(client_socket, b"Unregistered successfully.")
         logging.info(f"Peer unregistered: {client_addr}")
     else:
-        client_socket.send(b"You were not registered.")
+        await send_msg(client_socket, b"You were not registered.")
         logging.warning(f"Attempt to unregister non-existent peer: {client_addr}")
     client_socket.close()
 
 def force_unregister(client_addr_tuple):
     client_ip = client_addr_tuple[0]
 
-    for addr in PEER_and_LIST_PIECES.keys():
-        if client_ip == addr.split(":")[0]:
-            with data_lock:
-                PEER_and_LIST_PIECES.pop(addr, None)
-            logging.info(f"!Force to unregister peer  {addr} from network due to <Connection Error>.")
-        else:
-            logging.warning(f"Attempt to unregister non-existent peer: {client_ip}")
+    with ip_index_lock:
+        addrs = IP_INDEX.pop(client_ip, ())
+    # One lock acquisition per shard, however many peers the ip had there
+    by_shard = defaultdict(list)
+    for addr in addrs:
+        by_shard[_shard_index(addr)].append(addr)
+    removed = []
+    for index, shard_addrs in by_shard.items():
+        lock, peers = SHARDS[index]
+        with lock:
+            for addr in shard_addrs:
+                if peers.pop(addr, None) is not None:
+                    # The peer may have registered again since the pop above,
+                    # drop the entry that registration put back in the index
+                    unindex_peer(client_ip, addr)
+                    removed.append(addr)
+    if removed:
+        mark_peers_changed()
+    for addr in removed:
+        logging.info(f"!Force to unregister peer  {addr} from network due to <Connection Error>.")
+    if not removed:
+        logging.warning(f"Attempt to unregister non-existent peer: {client_ip}")
 
-def handle_client(client_socket, addr):
-    try:
-        request = client_socket.recv(1024).decode()
-        if not request:
-            return
+class Connection:
+    # Per-connection state handed to the command handlers
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.ip = addr[0]
+        self.reader = FramedReader(sock)
+        self.port = None
+        self.client_addr = None
 
-        command, *args = request.split()
+    def peer_addr(self, port):
+        # "ip:port" of the peer, formatted once per connection instead of per command
+        if port != self.port:
+            self.port = port
+            self.client_addr = f"{self.ip}:{port}"
+        return self.client_addr
 
-        if command == "REGISTER":
-            logging.info(f"Command received: <REGISTER>")
-            handle_register(addr[0], int(args[1]), client_socket)
-            response = client_socket.recv(BUFFER_SIZE).decode()
-            if response == "DONE":
-                request_hash_list(addr[0], int(args[1]), client_socket)
-            else:
-                logging.warning(f"Unexpected response from {addr} during registration! Respnse: {response}")
+# Command handlers by opcode. Each takes the connection and the raw frame and
+# returns True when the connection is finished.
+async def _do_update_pieces(conn, request):
+    client_addr = conn.peer_addr(PORT_FRAME.unpack_from(request)[1])
+    handle_update_pieces(conn.ip, client_addr, memoryview(request)[PORT_FRAME.size:])
 
-        elif command == "UPDATE_PIECE":
-            handle_update_piece(addr[0], int(args[1]), args[2], 1)
+async def _do_register(conn, request):
+    logging.info(f"Command received: <REGISTER>")
+    _, port, count = REGISTER_FRAME.unpack_from(request)
+    client_addr = conn.peer_addr(port)
+    data = memoryview(request)[REGISTER_FRAME.size:]
+    if len(data) != count * HASH_SIZE:
+        logging.error(f"Malformed hash list from {client_addr}: {len(data)} bytes for {count} hashes")
+        return
+    await handle_register(conn.ip, client_addr, conn.sock, data)
 
-        elif command == "GET_PEERS_DICT":
-            logging.info(f"Command received: <GET_PEERS_DICT>")
-            handle_get_list_peer(client_socket)
+async def _do_get_peers_dict(conn, request):
+    logging.info(f"Command received: <GET_PEERS_DICT>")
+    await handle_get_list_peer(conn.sock, request[1:].decode())
 
-        elif command == "UNREGISTER":
-            logging.info(f"Command received: <UNREGISTER>")
-            handle_unregister(addr[0], int(args[1]), client_socket)
-        
-        else:
-            logging.warning(f"UNEXPECTED request from {addr}: {request}")
+async def _do_unregister(conn, request):
+    logging.info(f"Command received: <UNREGISTER>")
+    client_addr = conn.peer_addr(PORT_FRAME.unpack_from(request)[1])
+    await handle_unregister(conn.ip, client_addr, conn.sock)
+    return True
+
+async def _do_unknown(conn, request):
+    logging.warning(f"UNEXPECTED request from {conn.addr}: {bytes(request[:64])}")
+
+# UPDATE_PIECE isn't here, handle_client runs it inline
+DISPATCH = {
+    OP_REGISTER: _do_register,
+    OP_UPDATE_PIECES: _do_update_pieces,
+    OP_GET_PEERS_DICT: _do_get_peers_dict,
+    OP_UNREGISTER: _do_unregister,
+}
+
+async def handle_client(client_socket, addr):
+    conn = Connection(client_socket, addr)
+    try:
+        # A connection carries any number of framed commands until the peer closes it
+        while True:
+            request = await conn.reader.read_message()
+            if not request:
+                return
+
+            if request[0] == OP_UPDATE_PIECE:
+                # Hottest path, one fixed size frame per downloaded piece
+                _, port, hash_value = UPDATE_PIECE_FRAME.unpack_from(request)
+                handle_update_piece(conn.ip, conn.peer_addr(port), hash_value, 1)
+                continue
+
+            if await DISPATCH.get(request[0], _do_unknown)(conn, request):
+                return
 
     except socket.error as e:
         logging.error(f"<Connection Error> with {addr}: {e}")
@@ -163,22 +490,65 @@ def handle_client(client_socket, addr):
         logging.error(f"Unexpected error with {addr}: {e}")
         force_unregister(addr)
     finally:
+        conn.reader.close()
         if DEBUG_DISCONNECTION:
             logging.info(f"Closing connection with {addr}")
         client_socket.close()
 
-def start_tracker(host='0.0.0.0', port=5000):
+def accept_pending(server):
+    # Accept every queued connection of a non-blocking server socket
+    while True:
+        try:
+            yield server.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+
+def new_listen_socket(host, port):
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        # every event loop thread binds its own socket, the kernel spreads connections
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    # inherited by accepted sockets, control messages are small and must not wait on Nagle
+    server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
     server.bind((host, port))
-    server.listen(100)
-    logging.info(f"Tracker running on {host}:{port}")
-    
-    with ThreadPoolExecutor(max_workers=100) as executor:
-        while True:
-            client_sock, addr = server.accept()
+    server.listen(LISTEN_BACKLOG)
+    server.setblocking(False)
+    return server
+
+async def accept_loop(server):
+    # Wait for readiness on the event loop and accept the whole backlog on each
+    # wakeup, every connection is served by a coroutine instead of a thread
+    loop = asyncio.get_running_loop()
+    clients = set() # strong references, the loop only keeps weak ones to tasks
+    while True:
+        await wait_readable(server)
+        for client_sock, addr in accept_pending(server):
+            client_sock.setblocking(False)
+            client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             #logging.info(f"===========================")
             #logging.info(f"Connection from {addr}")
-            executor.submit(handle_client, client_sock, addr)
+            task = loop.create_task(handle_client(client_sock, addr))
+            clients.add(task)
+            task.add_done_callback(clients.discard)
+
+def run_loop(server):
+    loop = new_event_loop()
+    try:
+        loop.run_until_complete(accept_loop(server))
+    finally:
+        loop.close()
+
+def start_tracker(host='0.0.0.0', port=5000):
+    accept_threads = ACCEPT_THREADS if hasattr(socket, "SO_REUSEPORT") else 1
+    servers = [new_listen_socket(host, port) for _ in range(accept_threads)]
+    logging.info(f"Tracker running on {host}:{port}")
+
+    for server in servers[1:]:
+        threading.Thread(target=run_loop, args=(server,), daemon=True).start()
+    run_loop(servers[0])
 
 if __name__ == '__main__':
     start_tracker()
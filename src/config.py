@@ -9,26 +9,40 @@ LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO') # Example using env var
 DEFAULT_LISTEN_HOST = '0.0.0.0'
 DEFAULT_LISTEN_PORT = 0 # 0 means OS chooses a free port
 SOCKET_LISTEN_BACKLOG = 5
+ACCEPT_ERROR_BACKOFF_MIN = 0.05 # seconds, first wait after a failed accept
+ACCEPT_ERROR_BACKOFF_MAX = 1.0 # seconds, cap of the doubling wait
 SOCKET_BUFFER_SIZE = 4096
+SOCKET_RCVBUF = int(os.environ.get('P2P_RCVBUF', 1024 * 1024)) # bytes, kernel receive buffer of peer and tracker sockets
+SOCKET_SNDBUF = int(os.environ.get('P2P_SNDBUF', 1024 * 1024)) # bytes, kernel send buffer of peer and tracker sockets
+SEND_QUEUE_MAX_SIZE = 1024 # messages waiting per connection, a peer that lets it fill up is dropped
 STUN_SERVERS = [
     ("stun.l.google.com", 19302),
     ("stun1.l.google.com", 19302),
     ("stun.ekiga.net", 3478)
 ]
 STUN_TIMEOUT = 0.5 # seconds
+STUN_DISCOVERY_TIMEOUT = 2.0 # seconds to wait for the first of the concurrent probes
+PUBLIC_IP_CACHE_TTL = 300 # seconds a discovered public IP is reused
 PUBLIC_IP_FALLBACK_SERVER = ("8.8.8.8", 80)
+PEER_CONNECT_TIMEOUT = 3.0 # seconds per connect attempt to a peer
+PEER_CONNECT_WORKERS = 16 # peers connected to at once, the rest wait for a free worker
 DEFAULT_MAX_PARALLEL_REQUESTS = 16
+PIECE_FRAME_CACHE_SIZE = 16 # built piece frames kept for peers requesting the same piece, when sendfile isn't available
+MAX_TRACKED_PEERS = 1024 # peers whose pieces are remembered, the least recently active are forgotten first
 DEFAULT_REQUEST_TIMEOUT = 60  # seconds
 DEFAULT_MAX_UNCHOKED_PEERS = 4
 DEFAULT_PIPELINE_DEPTH = 5
+MAX_PER_PEER_PIPELINE = 8 # outstanding piece requests per peer, more wait for a reply or another peer
 CHOKING_INTERVAL = 10 # seconds
 TRACKER_HEARTBEAT_INTERVAL = 30 # seconds
-TRACKER_RECONNECT_DELAY = 5 # seconds
+TRACKER_BITFIELD_REFRESH_INTERVAL = 120 # seconds, an unchanged bitfield is still resent this often so the tracker keeps the node
+TRACKER_RECONNECT_DELAY = 5 # seconds, first wait after losing the tracker
+TRACKER_RECONNECT_DELAY_MAX = 60 # seconds, cap of the doubling wait between failed reconnects
 TRACKER_CONNECT_RETRY_ATTEMPTS = 3
-REQUEST_QUEUE_PROCESS_INTERVAL = 0.1 # seconds
-REQUEST_TIMEOUT_CHECK_INTERVAL = 5 # seconds
-REQUEUE_PRIORITY_BOOST = 10 # Simple offset used in requeueing
-REQUEST_FLOOD_DELAY = 0.05 # Small delay in request processing loop
+REQUEST_QUEUE_PROCESS_INTERVAL = 0.1 # seconds to wait before retrying a piece no peer can serve
+REQUEST_TIMEOUT_CHECK_INTERVAL = 5 # seconds, longest sleep of the timeout checker when no deadline is sooner
+REQUEUE_PRIORITY_BOOST = 10 # queue tickets a piece no peer can serve moves back by
+TIMEOUT_REQUEUE_PRIORITY_BOOST = 1_000_000 # queue tickets a timed out piece moves ahead by, i.e. before anything queued
 
 # --- Tracker Constants ---
 DEFAULT_TRACKER_HOST = '0.0.0.0' 
@@ -39,6 +53,13 @@ MAX_MESSAGE_SIZE = 1024 * 1024  # 1MB max message buffer size
 
 # --- Piece Management (Example) ---
 DEFAULT_OUTPUT_DIR = './data'
+DEMO_FILE_CHUNK_SIZE = 8 * 1024 * 1024 # 8MB per random write when generating demo data
+
+# --- CLI Status Logging ---
+SEEDER_STATS_INTERVAL = 10 # seconds
+LEECHER_PROGRESS_INTERVAL = 5 # seconds
+LEECHER_PEER_REQUEST_INTERVAL = 30 # seconds
+COMPLETION_CHECK_INTERVAL = 1 # seconds between download completion checks
 
 # DEFAULTS = {
 #     "tracker_host": DEFAULT_TRACKER_HOST,
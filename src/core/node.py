@@ -1,31 +1,95 @@
 # src/core/node.py
+import os
 import time
+import heapq
+import itertools
 import queue
 import random
 import socket
 import logging
+import selectors
 import threading
+from functools import partial
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from typing import List, Dict, Optional
 
-from src.network.messages import Message, MessageFactory
-from src.network.connection import SocketWrapper
+from src.network.messages import Message, MessageFactory, PIECE_FRAME_HEADER
+from src.network.connection import SocketWrapper, tune_socket_buffers
 from src.states.node_state import NodeStateType
 from src.states.leecher_state import LeecherState
 from src.states.seeder_state import SeederState
 from src.strategies.choking import UploadSlotManager
 from src.strategies.piece_selection import PieceSelectionManager
 from src.torrent.piece_manager import PieceManager
+from src.torrent.bitfield import Bitfield
 
 from src.config import *
 
+# Parameterless messages are serialized once and shared by every send
+_CHOKE_MSG = MessageFactory.choke()
+_UNCHOKE_MSG = MessageFactory.unchoke()
+
+# Public IP found by the last successful discovery, shared by every Node
+_ip_cache = {"ip": None, "ts": 0.0}
+_ip_cache_lock = threading.Lock()
+
+# Idle UDP socket per probed server, reused by the next probe of that server
+_stun_sockets = {}
+_stun_sockets_lock = threading.Lock()
+
+def _probe_stun_server(host: str, port: int) -> str:
+    """Return the local address the route to a STUN server goes out from."""
+    server = (host, port)
+    # Take the socket out of the pool so concurrent probes never share one
+    with _stun_sockets_lock:
+        s = _stun_sockets.pop(server, None)
+    if s is None:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(STUN_TIMEOUT)
+    try:
+        s.connect(server)
+        ip = s.getsockname()[0]
+    except OSError:
+        # Don't keep a socket in an unknown state
+        s.close()
+        raise
+    with _stun_sockets_lock:
+        if server in _stun_sockets:
+            s.close()
+        else:
+            _stun_sockets[server] = s
+    return ip
+
 class Node:
+    # Fixed attribute set, grouped like in __init__, no per-instance __dict__
+    __slots__ = (
+        # Piece management
+        'my_pieces', 'piece_manager', '_piece_frame_cache', 'piece_availability', 'peer_pieces', '_piece_owners', 'peer_interested',
+        # State management
+        'state',
+        # Networking components
+        'listen_host', 'listen_port', 'address', 'tracker_host', 'tracker_port', 'tracker_connection',
+        '_reconnect_event', 'peer_connections', '_connecting', '_connect_pool', 'server_socket',
+        # Request management
+        '_rq_heap', '_rq_cv', '_rq_ticket', 'pending_requests', '_outstanding_per_peer', '_deadline_heap',
+        'max_parallel_requests', 'request_timeout', '_disk_queue',
+        # Choking management
+        'choked_peers', 'unchoked_peers', 'max_unchoked', 'upload_manager',
+        # Strategy components
+        'piece_selection_manager', 'max_pipeline_depth',
+        # Threading
+        '_pieces_lock', '_pending_lock', '_peers_lock', 'running',
+    )
+
     def __init__(self, listen_host: str=DEFAULT_LISTEN_HOST, listen_port: int=DEFAULT_LISTEN_PORT):
         # Piece management
-        self.available_pieces = []
-        self.my_pieces = set()
+        self.my_pieces = set() # set or Bitfield once the piece count is known
         self.piece_manager = None
+        self._piece_frame_cache = OrderedDict() # {piece_id: frame}, least recently sent first
         self.piece_availability = {}  # {piece_id: count}
-        self.peer_pieces = {}  # {peer_address: set(piece_ids)}
+        self.peer_pieces = OrderedDict()  # {peer_address: set(piece_ids)}, least recently active first
+        self._piece_owners = {}  # {piece_id: set(peer_addresses)}, inverse of peer_pieces
         self.peer_interested = {} # {peer_address: bool}
         
         # State management
@@ -35,13 +99,23 @@ class Node:
         self.listen_host = listen_host
         self.listen_port = listen_port
         self.address = None
+        self.tracker_host = None
+        self.tracker_port = None
         self.tracker_connection = None
+        self._reconnect_event = threading.Event() # set when the tracker connection is lost
         self.peer_connections = {} # {address: SocketWrapper}
+        self._connecting = set() # peer addresses with a connect in flight
+        self._connect_pool = ThreadPoolExecutor(max_workers=PEER_CONNECT_WORKERS, thread_name_prefix="peer-connect")
         self.server_socket = None
         
         # Request management
-        self.request_queue = queue.PriorityQueue()
-        self.pending_requests = {} # {piece_id: {peer: address, timestamp: time}}
+        self._rq_heap = [] # (priority, piece_id), lower priority value is served first
+        self._rq_ticket = itertools.count() # increasing int priorities, FIFO order of queued pieces
+        self._rq_cv = threading.Condition() # guards _rq_heap, signalled when it grows or a request slot frees
+        self.pending_requests = {} # {piece_id: {peer: address, timestamp: time.monotonic()}}
+        self._outstanding_per_peer = defaultdict(int) # {peer_address: pending request count}
+        self._deadline_heap = [] # (deadline, piece_id) of queued and pending pieces, stale entries are skipped when popped
+        self._disk_queue = queue.Queue() # (piece_id, data, peer_address) received pieces waiting to be stored
         self.max_parallel_requests = DEFAULT_MAX_PARALLEL_REQUESTS
         self.request_timeout = DEFAULT_REQUEST_TIMEOUT
         
@@ -55,8 +129,10 @@ class Node:
         self.piece_selection_manager = None
         self.max_pipeline_depth = DEFAULT_PIPELINE_DEPTH
         
-        # Threading
-        self.lock = threading.RLock()
+        # Threading, locks are always taken in pieces -> pending -> peers order
+        self._pieces_lock = threading.Lock() # _piece_frame_cache, piece_availability, peer_pieces, _piece_owners, my_pieces, available_pieces
+        self._pending_lock = threading.Lock() # pending_requests, _outstanding_per_peer, _deadline_heap
+        self._peers_lock = threading.RLock() # peer_connections, _connecting, choked_peers, unchoked_peers, tracker_connection
         self.running = False
 
     def start(self) -> None:
@@ -66,6 +142,7 @@ class Node:
         # Start listening server
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        tune_socket_buffers(self.server_socket) # before listen() so accepted sockets start with them
         self.server_socket.bind((self.listen_host, self.listen_port))
 
         actual_port = self.server_socket.getsockname()[1]
@@ -81,7 +158,9 @@ class Node:
             threading.Thread(target=self._accept_connections, daemon=True),
             threading.Thread(target=self._process_request_queue, daemon=True),
             threading.Thread(target=self._update_choking_state_periodically, daemon=True),
-            threading.Thread(target=self._check_request_timeouts, daemon=True)
+            threading.Thread(target=self._check_request_timeouts, daemon=True),
+            threading.Thread(target=self._reconnect_to_tracker, daemon=True),
+            threading.Thread(target=self._store_received_pieces, daemon=True)
         ]
         
         for thread in threads:
@@ -89,109 +168,206 @@ class Node:
 
         logging.info(f"Node started at {self.address}")
 
-    def discover_public_ip(self) -> str:
-        """Try to discover public IP address for NAT traversal"""
-        # Try multiple STUN-like services
-        for host, port in STUN_SERVERS:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                    s.settimeout(STUN_TIMEOUT)
-                    s.connect((host, port))
-                    return s.getsockname()[0]
-            except (socket.timeout, socket.gaierror, OSError):
-                continue
+    def discover_public_ip(self, force: bool = False) -> str:
+        """
+        Try to discover public IP address for NAT traversal
+
+        Args:
+            force(bool): probe again even if this node already has an address
+        """
+        if self.address and not force:
+            return self.address.rsplit(":", 1)[0]
+
+        with _ip_cache_lock:
+            if _ip_cache["ip"] and time.monotonic() - _ip_cache["ts"] < PUBLIC_IP_CACHE_TTL:
+                return _ip_cache["ip"]
+
+        # Probe every STUN-like service at once and take the first answer
+        pool = ThreadPoolExecutor(max_workers=len(STUN_SERVERS))
+        try:
+            futures = [pool.submit(_probe_stun_server, host, port) for host, port in STUN_SERVERS]
+            for future in as_completed(futures, timeout=STUN_DISCOVERY_TIMEOUT):
+                try:
+                    ip = future.result()
+                except (socket.timeout, socket.gaierror, OSError):
+                    continue
+                with _ip_cache_lock:
+                    _ip_cache["ip"] = ip
+                    _ip_cache["ts"] = time.monotonic()
+                return ip
+        except FuturesTimeoutError:
+            pass
+        finally:
+            # Don't wait for the slower probes
+            pool.shutdown(wait=False, cancel_futures=True)
         
         # Fallback to local IP if public discovery fails
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                # Doesn't actually connect but sets up routing
-                s.connect(PUBLIC_IP_FALLBACK_SERVER)
-                return s.getsockname()[0]
+            # Doesn't actually connect but sets up routing
+            return _probe_stun_server(*PUBLIC_IP_FALLBACK_SERVER)
         except (socket.error, OSError):
             return "127.0.0.1"
     
     def _accept_connections(self) -> None:
         """Accept incoming connections from peers."""
-        while self.running:
-            try:
-                client_socket, address = self.server_socket.accept()
-                peer_address = f"{address[0]}:{address[1]}"
-                logging.info(f"Accepted connection from {peer_address}")
-                
-                # Create a socket wrapper for this connection
-                socket_wrapper = SocketWrapper(None, None)
-                socket_wrapper.socket = client_socket
-                
-                # Setup callbacks and start the socket wrapper
-                socket_wrapper.register_callback(
-                    self._handle_incoming_peer_message(peer_address)
-                )
-                socket_wrapper.start()
-                
-                # Add to peer connections
-                with self.lock:
-                    self.peer_connections[peer_address] = socket_wrapper
-                    
-            except (socket.error, socket.timeout) as e:
-                if self.running:
-                    logging.error(f"Error accepting connection: {e}")
-            except Exception as e:
-                if self.running:
-                    logging.error(f"Unexpected error accepting connection: {e}", exc_info=True)
-            finally:
-                time.sleep(0.1)
-
-    def _handle_incoming_peer_message(self, peer_address: str):
-        """Returns a callback function for handling messages from a specific peer"""
-        def callback(message):
-            self._handle_peer_message(message, peer_address)
-        return callback
+        self.server_socket.setblocking(False)
+        selector = selectors.DefaultSelector()
+        selector.register(self.server_socket, selectors.EVENT_READ)
+        backoff = ACCEPT_ERROR_BACKOFF_MIN
+
+        try:
+            while self.running:
+                # Wait for a pending connection, the timeout lets us notice running going False
+                if not selector.select(timeout=1.0):
+                    continue
+                try:
+                    client_socket, address = self.server_socket.accept()
+                except (BlockingIOError, InterruptedError):
+                    continue # another wakeup took it
+                except (socket.error, socket.timeout) as e:
+                    if self.running:
+                        logging.error(f"Error accepting connection: {e}")
+                        time.sleep(backoff)
+                        backoff = min(backoff * 2, ACCEPT_ERROR_BACKOFF_MAX)
+                    continue
+
+                backoff = ACCEPT_ERROR_BACKOFF_MIN
+                try:
+                    self._add_incoming_connection(client_socket, address)
+                except Exception as e:
+                    if self.running:
+                        logging.error(f"Unexpected error accepting connection: {e}", exc_info=True)
+        finally:
+            selector.close()
+
+    def _add_incoming_connection(self, client_socket: socket.socket, address) -> None:
+        """Wrap an accepted socket and start serving the peer on it."""
+        client_socket.setblocking(True)
+        tune_socket_buffers(client_socket)
+        peer_address = f"{address[0]}:{address[1]}"
+        logging.info(f"Accepted connection from {peer_address}")
+        
+        # Create a socket wrapper for this connection
+        socket_wrapper = SocketWrapper(None, None)
+        socket_wrapper.socket = client_socket
+        
+        # Setup callbacks and start the socket wrapper
+        socket_wrapper.register_callback(
+            partial(self._handle_peer_message, address=peer_address)
+        )
+        socket_wrapper.start()
+        
+        # Add to peer connections, peers start choked until the choking job unchokes them
+        with self._peers_lock:
+            self.peer_connections[peer_address] = socket_wrapper
+            self.choked_peers.add(peer_address)
+        self._send_bitfield(socket_wrapper)
     
     def _process_request_queue(self) -> None:
         """Process the piece request queue"""
         while self.running:
             try:
-                # Check if we have room for more parallel requests
-                with self.lock:
-                    if len(self.pending_requests) >= self.max_parallel_requests:
-                        time.sleep(REQUEST_QUEUE_PROCESS_INTERVAL)
+                # Sleep until a piece is queued and there's room for another parallel request
+                with self._rq_cv:
+                    ready = self._rq_cv.wait_for(
+                        lambda: self._rq_heap and len(self.pending_requests) < self.max_parallel_requests,
+                        timeout=1.0
+                    )
+                    if not ready:
                         continue
+                    # Drain as many pieces as there are free request slots
+                    free_slots = self.max_parallel_requests - len(self.pending_requests)
+                    batch = [heapq.heappop(self._rq_heap)
+                             for _ in range(min(free_slots, len(self._rq_heap)))]
+                with self._pending_lock:
+                    outstanding = dict(self._outstanding_per_peer)
                 
-                # Get the highest priority request
-                if self.request_queue.empty():
-                    time.sleep(REQUEST_QUEUE_PROCESS_INTERVAL)
-                    continue
-                
-                priority, piece_id = self.request_queue.get()
-                
-                # Find suitable peer and send request
-                peer = self._select_peer_for_piece(piece_id)
-                if peer:
-                    self._send_piece_request(piece_id, peer)
-                else:
-                    # No suitable peer found, requeue with lower priority
-                    new_priority = priority + REQUEUE_PRIORITY_BOOST
-                    self.request_queue.put((new_priority, piece_id))
-                
-                # Small delay to avoid flooding
-                time.sleep(REQUEST_FLOOD_DELAY)
+                # Group the pieces by the peer chosen for them, one message per peer,
+                # skipping peers that already have a full pipeline of requests
+                requests_by_peer = defaultdict(list)
+                busy = {peer for peer, count in outstanding.items() if count >= MAX_PER_PEER_PIPELINE}
+                unserved = []
+                for priority, piece_id in batch:
+                    peer = self._select_peer_for_piece(piece_id, exclude=busy)
+                    if peer:
+                        requests_by_peer[peer].append(piece_id)
+                        if outstanding.get(peer, 0) + len(requests_by_peer[peer]) >= MAX_PER_PEER_PIPELINE:
+                            busy.add(peer)
+                    else:
+                        unserved.append((priority, piece_id))
+
+                for peer, piece_ids in requests_by_peer.items():
+                    self._send_piece_requests(piece_ids, peer)
+
+                if unserved:
+                    # No suitable peer found, requeue with lower priority and wait
+                    # for new work or a freed slot before trying again
+                    with self._rq_cv:
+                        for priority, piece_id in unserved:
+                            heapq.heappush(self._rq_heap, (priority + REQUEUE_PRIORITY_BOOST, piece_id))
+                        if not requests_by_peer:
+                            self._rq_cv.wait(REQUEST_QUEUE_PROCESS_INTERVAL)
                 
             except Exception as e:
                 logging.error(f"Error processing request queue: {e}", exc_info=True)
                 time.sleep(1)
 
-    def _send_piece_request(self, piece_id: int, peer_address: str) -> None:
-        """Send a piece request to a peer and update pending requests"""
-        if peer_address in self.peer_connections:
-            request_msg = MessageFactory.request_piece(piece_id)
-            self.peer_connections[peer_address].send(request_msg)
-            
-            # Track the request
-            with self.lock:
+    def _push_piece_request(self, priority: int, piece_id: int) -> None:
+        """Add a piece to the request queue and wake the request processor."""
+        with self._rq_cv:
+            heapq.heappush(self._rq_heap, (priority, piece_id))
+            self._rq_cv.notify()
+
+    def _notify_request_slot(self) -> None:
+        """Wake the request processor after pending_requests shrank."""
+        with self._rq_cv:
+            self._rq_cv.notify()
+
+    def _send_piece_requests(self, piece_ids: List[int], peer_address: str) -> None:
+        """Send piece requests to a peer in a single message and update pending requests"""
+        with self._peers_lock:
+            connection = self.peer_connections.get(peer_address)
+        if connection:
+            if len(piece_ids) == 1:
+                request_msg = MessageFactory.piece_request(piece_ids[0])
+            else:
+                request_msg = MessageFactory.piece_request_batch(piece_ids)
+            connection.send(request_msg)
+            self._track_pending_requests(piece_ids, peer_address)
+
+    def _schedule_timeout(self, piece_id: int, timestamp: Optional[float] = None) -> None:
+        """Schedule a timeout check for a piece marked in progress."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._pending_lock:
+            heapq.heappush(self._deadline_heap, (timestamp + self.request_timeout, piece_id))
+
+    def _track_pending_requests(self, piece_ids: List[int], peer_address: str, timestamp: Optional[float] = None) -> None:
+        """Record requests sent to a peer and schedule their timeout."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        deadline = timestamp + self.request_timeout
+        with self._pending_lock:
+            for piece_id in piece_ids:
+                self._pop_pending_request(piece_id)
                 self.pending_requests[piece_id] = {
                     'peer': peer_address,
-                    'timestamp': time.time()
+                    'timestamp': timestamp
                 }
+                self._outstanding_per_peer[peer_address] += 1
+                heapq.heappush(self._deadline_heap, (deadline, piece_id))
+
+    def _pop_pending_request(self, piece_id: int) -> Optional[Dict]:
+        """Forget a pending request and free its peer's pipeline slot, caller holds _pending_lock."""
+        request_info = self.pending_requests.pop(piece_id, None)
+        if request_info:
+            peer_address = request_info['peer']
+            remaining = self._outstanding_per_peer[peer_address] - 1
+            if remaining > 0:
+                self._outstanding_per_peer[peer_address] = remaining
+            else:
+                del self._outstanding_per_peer[peer_address]
+        return request_info
 
     def _update_choking_state_periodically(self) -> None:
         """Periodically update which peers are choked/unchoked based on current strategy."""
@@ -205,29 +381,34 @@ class Node:
                 
     def _update_choking_state(self) -> None:
         """Update which peers should be choked/unchoked according to strategy"""
-        with self.lock:
-            # Get list of peers that should be unchoked according to strategy
-            peers_to_unchoke = self.upload_manager.get_unchoked_peers()
-            
-            # Find peers needing state changes
-            to_choke = self.unchoked_peers - peers_to_unchoke
-            to_unchoke = peers_to_unchoke - self.unchoked_peers
-            
-            for peer in to_choke:
-                if peer in self.peer_connections and peer in self.unchoked_peers:
-                    choke_msg = MessageFactory.choke()
-                    self.peer_connections[peer].send(choke_msg)
-                    self.unchoked_peers.remove(peer)
-                    self.choked_peers.add(peer)
-                    logging.info(f"Choking peer {peer}")
-            
-            for peer in to_unchoke:
-                if peer in self.peer_connections and peer in self.choked_peers:
-                    unchoke_msg = MessageFactory.unchoke()
-                    self.peer_connections[peer].send(unchoke_msg)
-                    self.choked_peers.remove(peer)
-                    self.unchoked_peers.add(peer)
-                    logging.info(f"Unchoking peer {peer}")
+        # Get list of peers that should be unchoked according to strategy
+        peers_to_unchoke = self.upload_manager.get_unchoked_peers()
+
+        # Decide and record the changes under the lock, send once it is released
+        with self._peers_lock:
+            connected = self.peer_connections.keys()
+            to_choke = [
+                (peer, self.peer_connections[peer])
+                for peer in (self.unchoked_peers - peers_to_unchoke) & connected
+            ]
+            to_unchoke = [
+                (peer, self.peer_connections[peer])
+                for peer in (peers_to_unchoke - self.unchoked_peers) & self.choked_peers & connected
+            ]
+            for peer, _ in to_choke:
+                self.unchoked_peers.remove(peer)
+                self.choked_peers.add(peer)
+            for peer, _ in to_unchoke:
+                self.choked_peers.remove(peer)
+                self.unchoked_peers.add(peer)
+
+        for peer, connection in to_choke:
+            connection.send(_CHOKE_MSG)
+            logging.info(f"Choking peer {peer}")
+
+        for peer, connection in to_unchoke:
+            connection.send(_UNCHOKE_MSG)
+            logging.info(f"Unchoking peer {peer}")
     
     def _check_request_timeouts(self) -> None:
         """Check for piece request timeouts and requeue them."""
@@ -235,29 +416,46 @@ class Node:
             if not self.piece_manager:
                 time.sleep(1)
                 continue
-            self._process_timeout_checks()
-            time.sleep(REQUEST_TIMEOUT_CHECK_INTERVAL)
+            next_deadline = self._process_timeout_checks()
+            # Sleep until the earliest deadline, deadlines pushed meanwhile are
+            # never earlier since they all use the same timeout
+            delay = REQUEST_TIMEOUT_CHECK_INTERVAL
+            if next_deadline is not None:
+                delay = min(delay, max(0.01, next_deadline - time.monotonic()))
+            time.sleep(delay)
 
-    def _process_timeout_checks(self) -> None:
-        """Perform timeout checks and requeue pieces."""
-        current_time = time.time()
-        timed_out_pieces = []
+    def _process_timeout_checks(self) -> Optional[float]:
+        """
+        Perform timeout checks and requeue pieces.
 
-        # Check for timed out pieces in piece manager
-        timed_out_pieces.extend(self.piece_manager.check_timeouts(self.request_timeout))
+        Returns:
+            Optional[float]: Earliest deadline still scheduled, if any
+        """
+        current_time = time.monotonic()
+        timed_out_pieces = {} # ordered set, a piece may expire both ways
 
-        # Check our own pending requests
-        with self.lock:
-            for piece_id, request_info in list(self.pending_requests.items()):
-                if current_time - request_info['timestamp'] > self.request_timeout:
+        # Pop only the expired deadlines, entries of answered or re-sent requests are stale
+        with self._pending_lock:
+            heap = self._deadline_heap
+            while heap and heap[0][0] <= current_time:
+                _, piece_id = heapq.heappop(heap)
+                request_info = self.pending_requests.get(piece_id)
+                if request_info and request_info['timestamp'] + self.request_timeout <= current_time:
                     logging.debug(f"Request for piece {piece_id} timed out")
-                    del self.pending_requests[piece_id]
-                    timed_out_pieces.append(piece_id)
+                    self._pop_pending_request(piece_id)
+                    timed_out_pieces[piece_id] = None
+                # The piece manager holds the time the piece was marked in progress
+                if self.piece_manager.expire_in_progress(piece_id, self.request_timeout):
+                    timed_out_pieces[piece_id] = None
+            next_deadline = heap[0][0] if heap else None
 
-        # Requeue timed out pieces with high priority
-        for piece_id in timed_out_pieces:
-            priority = current_time - REQUEUE_PRIORITY_BOOST * 10  # Higher priority for timeouts
-            self.request_queue.put((priority, piece_id))
+        # Requeue timed out pieces ahead of the ones still waiting
+        with self._rq_cv:
+            for piece_id in timed_out_pieces:
+                priority = next(self._rq_ticket) - TIMEOUT_REQUEUE_PRIORITY_BOOST
+                heapq.heappush(self._rq_heap, (priority, piece_id))
+            self._rq_cv.notify()
+        return next_deadline
 
     def connect_to_tracker(self, tracker_host: str, tracker_port: int, retry_attempts=TRACKER_CONNECT_RETRY_ATTEMPTS) -> bool:
         """
@@ -299,11 +497,18 @@ class Node:
     
     def _tracker_heartbeat(self) -> None:
         """Send periodic updates to tracker."""
+        last_sent = None
+        last_sent_at = 0.0
         while self.running and self.tracker_connection:
             try:
-                # Send piece update
-                update_msg = MessageFactory.update_pieces(list(self.my_pieces))
-                self.tracker_connection.send(update_msg)
+                # Send every piece we have as a packed bitfield, skipped while nothing changed
+                # unless the tracker would soon consider the node inactive
+                packed = self._packed_pieces()
+                now = time.monotonic()
+                if packed != last_sent or now - last_sent_at >= TRACKER_BITFIELD_REFRESH_INTERVAL:
+                    self.tracker_connection.send(MessageFactory.bitfield(packed))
+                    last_sent = packed
+                    last_sent_at = now
 
                 # Wait for next heartbeat
                 for _ in range(TRACKER_HEARTBEAT_INTERVAL): 
@@ -316,18 +521,47 @@ class Node:
                 self._handle_tracker_disconnection()
                 return
 
+    def _packed_pieces(self) -> bytes:
+        """my_pieces as a packed bitfield, bit (i & 7) of byte (i >> 3) is piece i."""
+        with self._pieces_lock:
+            if isinstance(self.my_pieces, Bitfield):
+                return self.my_pieces.to_bytes()
+            size = max(self.my_pieces, default=-1) + 1
+            return Bitfield.from_pieces(size, self.my_pieces).to_bytes()
+
+    def _send_bitfield(self, connection: SocketWrapper) -> None:
+        """Tell a newly connected peer which pieces we have, so it can pick us for them."""
+        if len(self.my_pieces):
+            connection.send(MessageFactory.bitfield(self._packed_pieces()), droppable=True)
+
     def _handle_tracker_disconnection(self) -> None:
         """Handle tracker connection loss."""
         logging.warning("Lost connection to tracker")
-        with self.lock:
+        with self._peers_lock:
             self.tracker_connection = None
         
-        # Attempt reconnection after delay if node still running
+        # Wake the reconnect thread, repeated losses don't stack up retries
         if self.running:
-            threading.Timer(
-                TRACKER_RECONNECT_DELAY, 
-                lambda: self.connect_to_tracker(self.tracker_host, self.tracker_port)
-            ).start()
+            self._reconnect_event.set()
+
+    def _reconnect_to_tracker(self) -> None:
+        """Reconnect to the tracker after each connection loss, doubling the wait between failures."""
+        while self.running:
+            if not self._reconnect_event.wait(timeout=1.0):
+                continue
+            self._reconnect_event.clear()
+
+            delay = TRACKER_RECONNECT_DELAY
+            while self.running and not self.tracker_connection:
+                time.sleep(delay)
+                if not self.running or self.tracker_connection:
+                    break
+                try:
+                    if self.connect_to_tracker(self.tracker_host, self.tracker_port):
+                        break
+                except Exception as e:
+                    logging.error(f"Error reconnecting to tracker: {e}", exc_info=True)
+                delay = min(delay * 2, TRACKER_RECONNECT_DELAY_MAX)
 
     def _connect_to_peer(self, peer_address: str) -> bool:
         """Establish connection to a peer"""
@@ -335,18 +569,20 @@ class Node:
             host, port_str = peer_address.split(":")
             port = int(port_str)
             
-            socket_wrapper = SocketWrapper(host, port)
+            socket_wrapper = SocketWrapper(host, port, connect_timeout=PEER_CONNECT_TIMEOUT)
             if not socket_wrapper.connect():
                 logging.warning(f"Failed to connect to peer {peer_address}")
                 return False
                 
             socket_wrapper.register_callback(
-                self._handle_incoming_peer_message(peer_address)
+                partial(self._handle_peer_message, address=peer_address)
             )
             socket_wrapper.start()
             
-            with self.lock:
+            with self._peers_lock:
                 self.peer_connections[peer_address] = socket_wrapper
+                self.choked_peers.add(peer_address)
+            self._send_bitfield(socket_wrapper)
                 
             logging.info(f"Connected to peer {peer_address}")
             return True
@@ -354,6 +590,10 @@ class Node:
         except Exception as e:
             logging.error(f"Error connecting to peer {peer_address}: {e}")
             return False
+
+        finally:
+            with self._peers_lock:
+                self._connecting.discard(peer_address)
     
     def _handle_tracker_message(self, message: Message) -> None:
         """Process messages from the tracker."""
@@ -369,39 +609,90 @@ class Node:
         Args:
             peers: List of peer information from tracker
         """
-        with self.lock:
-            # Reset availability counts
-            for piece_id in self.piece_availability:
-                self.piece_availability[piece_id] = 0
-                
-            # Count pieces across all peers
+        with self._pieces_lock:
+            # Apply only what changed per peer instead of recounting every piece
+            listed = set()
             for peer in peers:
                 peer_address = peer.get("address")
-                pieces = peer.get("pieces", [])
                 
                 if peer_address and peer_address != self.address:
-                    # Update peer pieces tracking
-                    self.peer_pieces[peer_address] = set(pieces)
-                    
-                    # Update availability counts
-                    for piece_id in pieces:
-                        if piece_id in self.piece_availability:
-                            self.piece_availability[piece_id] += 1
-            
-            # Update available pieces list for strategy use
-            self.available_pieces = [
-                {"id": piece_id, "availability": count}
-                for piece_id, count in self.piece_availability.items()
-                if piece_id not in self.my_pieces
-            ]
+                    listed.add(peer_address)
+                    self._set_peer_pieces(peer_address, set(peer.get("pieces", [])))
+
+            # Peers missing from the list have left the swarm, unless they're connected
+            # and announce their pieces themselves
+            with self._peers_lock:
+                gone = [address for address in self.peer_pieces
+                        if address not in listed and address not in self.peer_connections]
+            for peer_address in gone:
+                self._adjust_ownership(peer_address, self.peer_pieces.pop(peer_address), -1)
+
+            self._forget_inactive_peers()
+
+    def _set_peer_pieces(self, peer_address: str, new_pieces: set) -> None:
+        """Replace the pieces known for a peer, caller holds _pieces_lock."""
+        old_pieces = self.peer_pieces.get(peer_address)
+        if old_pieces == new_pieces:
+            return
+        if old_pieces is None:
+            old_pieces = set()
+        self._adjust_ownership(peer_address, new_pieces - old_pieces, 1)
+        self._adjust_ownership(peer_address, old_pieces - new_pieces, -1)
+        # New peers and peers announcing pieces count as recently active
+        self.peer_pieces[peer_address] = new_pieces
+        self.peer_pieces.move_to_end(peer_address)
+
+    def _forget_inactive_peers(self) -> None:
+        """Bound the memory of large swarms, forget the least recently active peers, caller holds _pieces_lock."""
+        while len(self.peer_pieces) > MAX_TRACKED_PEERS:
+            peer_address, pieces = self.peer_pieces.popitem(last=False)
+            self._adjust_ownership(peer_address, pieces, -1)
+
+    def _adjust_ownership(self, peer_address: str, piece_ids, delta: int) -> None:
+        """Record that a peer gained (delta 1) or lost (delta -1) pieces, caller holds _pieces_lock."""
+        self._adjust_availability(piece_ids, delta)
+        owners = self._piece_owners
+        if delta > 0:
+            for piece_id in piece_ids:
+                owners.setdefault(piece_id, set()).add(peer_address)
+        else:
+            for piece_id in piece_ids:
+                peers = owners.get(piece_id)
+                if peers is not None:
+                    peers.discard(peer_address)
+                    if not peers:
+                        del owners[piece_id]
+
+    def _adjust_availability(self, piece_ids, delta: int) -> None:
+        """Add delta to the availability count of each piece, caller holds _pieces_lock."""
+        availability = self.piece_availability
+        for piece_id in piece_ids:
+            if piece_id in availability:
+                availability[piece_id] += delta
+
+    @property
+    def available_pieces(self):
+        """Generator of (piece_id, availability) for the pieces we don't have yet."""
+        return (
+            (piece_id, count)
+            for piece_id, count in self.piece_availability.items()
+            if piece_id not in self.my_pieces
+        )
 
     def _update_peer_connections(self, peers) -> None:
-        """Update peer connections based on tracker response."""
-        for peer in peers:
-            peer_address = peer.get("address")
-            if peer_address and peer_address != self.address:
-                if peer_address not in self.peer_connections:
-                    self._connect_to_peer(peer_address)
+        """Connect to the new peers of a tracker response on the connect pool, returns at once."""
+        new_peers = []
+        with self._peers_lock:
+            for peer in peers:
+                peer_address = peer.get("address")
+                if (peer_address and peer_address != self.address
+                        and peer_address not in self.peer_connections
+                        and peer_address not in self._connecting):
+                    self._connecting.add(peer_address)
+                    new_peers.append(peer_address)
+
+        for peer_address in new_peers:
+            self._connect_pool.submit(self._connect_to_peer, peer_address)
 
     def set_up_strategy_system(self, piece_count: int):
         self.piece_selection_manager = PieceSelectionManager(
@@ -423,6 +714,7 @@ class Node:
         """
         self.piece_manager = PieceManager(output_dir, piece_size, pieces_hashes, total_size)
         self.piece_manager.init_storage(filename)
+        self.my_pieces = Bitfield(len(pieces_hashes))
         
         # Initialize piece availability
         for i in range(len(pieces_hashes)):
@@ -431,48 +723,64 @@ class Node:
         self.piece_manager.close_storage()
 
     def update_choking(self):
-        """Update choking decisions based on strategy"""
-        peers_to_unchoke = self.upload_manager.get_unchoked_peers()
-        
-        new_unchoked = peers_to_unchoke - self.unchoked_peers
-        new_choked = self.unchoked_peers - peers_to_unchoke
-        
-        for peer in new_unchoked:
-            if peer in self.peer_connections:
-                self.peer_connections[peer].send(MessageFactory.unchoke())
-        
-        for peer in new_choked:
-            if peer in self.peer_connections:
-                self.peer_connections[peer].send(MessageFactory.choke())
-        
-        self.unchoked_peers = peers_to_unchoke
-        self.choked_peers = set(self.peer_connections.keys()) - peers_to_unchoke
+        """Update choking decisions based on strategy, only the peers changing state are visited"""
+        self._update_choking_state()
     
     def _handle_piece_received(self, piece_id: int, data: bytes) -> None:
-        """Process a received piece."""
+        """Process a received piece, storing it is left to the disk writer thread."""
         # Extract peer address from pending requests
         peer_address = None
-        with self.lock:
-            request_entry = self.pending_requests.pop(piece_id, None)
-            if request_entry:
-                peer_address = request_entry.get('peer')
+        with self._pending_lock:
+            request_entry = self._pop_pending_request(piece_id)
+        if request_entry:
+            peer_address = request_entry.get('peer')
+            self._notify_request_slot()
+
+        # Return right away so the socket reader thread keeps reading
+        self._disk_queue.put((piece_id, data, peer_address))
+
+    def _store_received_pieces(self) -> None:
+        """Disk writer thread, stores received pieces in arrival order."""
+        while self.running:
+            try:
+                piece_id, data, peer_address = self._disk_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self._store_piece(piece_id, data, peer_address)
+            except Exception as e:
+                logging.error(f"Error storing piece {piece_id}: {e}", exc_info=True)
 
-        # Verify and store the piece
+    def _store_piece(self, piece_id: int, data: bytes, peer_address: Optional[str]) -> None:
+        """Verify and store a received piece, then announce it."""
         success = self.piece_manager.receive_piece(piece_id, data)
+
+        # The peer that sent it is the last one to forget
+        if success and peer_address:
+            with self._pieces_lock:
+                if peer_address in self.peer_pieces:
+                    self.peer_pieces.move_to_end(peer_address)
         
         # Update statistics if we know the source peer
-        if success and peer_address and hasattr(self, 'upload_manager'):
+        if success and peer_address:
             self.upload_manager.update_peer_stats(
                 peer_address, 
                 bytes_downloaded=len(data)
             )
             
-            self.my_pieces.add(piece_id)
-            
-            # Update tracker
-            if self.tracker_connection:
-                update_msg = MessageFactory.update_pieces(list(self.my_pieces))
-                self.tracker_connection.send(update_msg)
+            with self._peers_lock:
+                tracker_connection = self.tracker_connection
+                peer_connections = list(self.peer_connections.values())
+            with self._pieces_lock:
+                self.my_pieces.add(piece_id)
+
+            # Tell the tracker and connected peers about this piece only, the heartbeat
+            # sends the tracker the full bitfield
+            have_msg = MessageFactory.have(piece_id)
+            if tracker_connection:
+                tracker_connection.send(have_msg, droppable=True)
+            for connection in peer_connections:
+                connection.send(have_msg, droppable=True)
             
             # Update piece selection
             if self.piece_selection_manager:
@@ -495,15 +803,22 @@ class Node:
             return
             
         try:
-            data = self.piece_manager.get_piece_data(piece_id)
-            if not data:
+            # Let the kernel send the piece straight from the file when it can
+            region = self.piece_manager.get_piece_region(piece_id) if hasattr(os, 'sendfile') else None
+            if region:
+                fd, offset, length = region
+                self.peer_connections[address].send_piece_zerocopy(piece_id, fd, offset, length)
+                self.upload_manager.update_peer_stats(address, bytes_uploaded=length)
+                return
+
+            response = self._piece_frame(piece_id)
+            if not response:
                 logging.error(f"Failed to retrieve data for piece {piece_id}")
                 return
                 
-            response = MessageFactory.piece_response(piece_id, data)
             self.peer_connections[address].send(response)
             # Track upload stats
-            self.upload_manager.update_peer_stats(address, bytes_uploaded=len(data))
+            self.upload_manager.update_peer_stats(address, bytes_uploaded=len(response) - PIECE_FRAME_HEADER.size)
         except IOError as e:
             logging.error(f"I/O error sending piece {piece_id}: {e}")
         except socket.error as e:
@@ -511,66 +826,139 @@ class Node:
         except Exception as e:
             logging.error(f"Error sending piece {piece_id}: {e}", exc_info=True)
     
+    def _piece_frame(self, piece_id: int) -> Optional[bytes]:
+        """Binary frame of a completed piece, built once and reused while it stays cached."""
+        with self._pieces_lock:
+            frame = self._piece_frame_cache.get(piece_id)
+            if frame is not None:
+                self._piece_frame_cache.move_to_end(piece_id)
+                return frame
+
+        data = self.piece_manager.get_piece_data(piece_id)
+        if not data:
+            return None
+        # Completed pieces never change, so a cached frame stays valid
+        frame = MessageFactory.piece_response_binary(piece_id, data)
+        with self._pieces_lock:
+            self._piece_frame_cache[piece_id] = frame
+            while len(self._piece_frame_cache) > PIECE_FRAME_CACHE_SIZE:
+                self._piece_frame_cache.popitem(last=False)
+        return frame
+
     def _handle_peer_message(self, message: Message, address: str) -> None:
         """Handle message from peers."""
         logging.debug(f"Processing {message.msg_type} from {address}")
         
-        if message.msg_type == "piece_request":
-            piece_id = message.payload.get("piece_id")
-            logging.debug(f"Received request for piece {piece_id} from {address}")
-            
-            # Check if we have the piece AND peer is unchoked AND peer is interested
-            if (piece_id in self.my_pieces 
-                and address in self.unchoked_peers 
-                and self.peer_interested.get(address, False)):
-                logging.info(f"Sending piece {piece_id} to {address}")
-                self._send_piece(piece_id, address)
-            else:
-                reason = "piece not available" if piece_id not in self.my_pieces \
-                    else "peer is choked" if address not in self.unchoked_peers \
-                    else "peer not interested"
-                logging.debug(f"Rejected piece request {piece_id} from {address}: {reason}")
-
-        elif message.msg_type == "interested":
-            # Mark peer as interested in our pieces
-            self.peer_interested[address] = True
-            logging.debug(f"Peer {address} is now interested")
-            
-            # Request immediate choke decision update
-            if hasattr(self, 'upload_manager'):
-                self.update_choking()
-                
-        elif message.msg_type == "not_interested":
-            # Mark peer as not interested in our pieces
-            self.peer_interested[address] = False
-            logging.debug(f"Peer {address} is no longer interested")
-
-        elif message.msg_type == "piece_response":
-            piece_id = message.payload.get("piece_id")
-            data_hex = message.payload.get("data")
-            
-            logging.debug(f"Received piece {piece_id} data from {address}")
-            
-            if piece_id and data_hex and piece_id in self.pending_requests:
-                try:
-                    data = bytes.fromhex(data_hex)
-                    self._handle_piece_received(piece_id, data)
-                    logging.info(f"Successfully processed piece {piece_id} from {address}")
-                except ValueError as e:
-                    logging.error(f"Invalid piece data from {address}: {e}")
-            else:
-                logging.debug(f"Ignored piece {piece_id}: not requested or missing data")
-
-        elif message.msg_type == "cancel_request":
-            piece_id = message.payload.get("piece_id")
-            logging.info(f"Received cancel request for piece {piece_id} from {address}")
-            
+        handler = self._PEER_MESSAGE_HANDLERS.get(message.msg_type)
+        if handler:
+            handler(self, message, address)
         else:
             logging.debug(f"Unhandled message type '{message.msg_type}' from {address}")
+
+    def _on_piece_request(self, message: Message, address: str) -> None:
+        """Serve a single piece request."""
+        self._serve_piece_request(message.payload.get("piece_id"), address)
+
+    def _on_piece_request_batch(self, message: Message, address: str) -> None:
+        """Serve every piece of a batched request."""
+        for piece_id in message.payload.get("piece_ids", []):
+            self._serve_piece_request(piece_id, address)
+
+    def _on_interested(self, message: Message, address: str) -> None:
+        """Record that a peer wants our pieces."""
+        # Mark peer as interested in our pieces
+        self.peer_interested[address] = True
+        logging.debug(f"Peer {address} is now interested")
+        
+        # Request immediate choke decision update
+        self.update_choking()
+
+    def _on_not_interested(self, message: Message, address: str) -> None:
+        """Record that a peer no longer wants our pieces."""
+        # Mark peer as not interested in our pieces
+        self.peer_interested[address] = False
+        logging.debug(f"Peer {address} is no longer interested")
+
+    def _on_piece_response(self, message: Message, address: str) -> None:
+        """Store piece data we requested."""
+        piece_id = message.payload.get("piece_id")
+        data = message.payload.get("data")
+        
+        logging.debug(f"Received piece {piece_id} data from {address}")
+        
+        if piece_id is not None and data and piece_id in self.pending_requests:
+            if isinstance(data, bytes):
+                self._handle_piece_received(piece_id, data)
+                logging.info(f"Successfully processed piece {piece_id} from {address}")
+            else:
+                logging.error(f"Invalid piece data from {address}: expected a binary piece frame")
+        else:
+            logging.debug(f"Ignored piece {piece_id}: not requested or missing data")
+
+    def _on_cancel_request(self, message: Message, address: str) -> None:
+        """Log a cancelled request, nothing is queued to withdraw."""
+        piece_id = message.payload.get("piece_id")
+        logging.info(f"Received cancel request for piece {piece_id} from {address}")
+
+    def _on_have(self, message: Message, address: str) -> None:
+        """Record a piece the peer just completed."""
+        piece_id = message.payload.get("piece_id")
+        if not isinstance(piece_id, int) or piece_id < 0:
+            logging.debug(f"Ignored have from {address}: invalid piece id {piece_id!r}")
+            return
+        with self._pieces_lock:
+            pieces = self.peer_pieces.get(address)
+            if pieces is None:
+                pieces = self.peer_pieces[address] = set()
+            if piece_id not in pieces:
+                pieces.add(piece_id)
+                self._adjust_ownership(address, (piece_id,), 1)
+            self.peer_pieces.move_to_end(address)
+            self._forget_inactive_peers()
+
+    def _on_bitfield(self, message: Message, address: str) -> None:
+        """Record every piece the peer has, sent when the connection opens."""
+        try:
+            packed = bytes.fromhex(message.payload.get("bitfield", ""))
+        except ValueError:
+            logging.debug(f"Ignored invalid bitfield from {address}")
+            return
+        with self._pieces_lock:
+            size = len(self.piece_availability) or None
+            self._set_peer_pieces(address, set(Bitfield.from_bytes(packed, size)))
+            self._forget_inactive_peers()
+
+    # Message type -> handler, looked up once per message instead of an if/elif chain
+    _PEER_MESSAGE_HANDLERS = {
+        "piece_request": _on_piece_request,
+        "piece_request_batch": _on_piece_request_batch,
+        "interested": _on_interested,
+        "not_interested": _on_not_interested,
+        "piece_response": _on_piece_response,
+        "cancel_request": _on_cancel_request,
+        "have": _on_have,
+        "bitfield": _on_bitfield,
+    }
     
+    def _serve_piece_request(self, piece_id: int, address: str) -> None:
+        """Send a requested piece if the peer is allowed to have it."""
+        logging.debug(f"Received request for piece {piece_id} from {address}")
+        
+        # Check if we have the piece AND peer is unchoked AND peer is interested
+        if (piece_id in self.my_pieces 
+            and address in self.unchoked_peers 
+            and self.peer_interested.get(address, False)):
+            logging.info(f"Sending piece {piece_id} to {address}")
+            self._send_piece(piece_id, address)
+        else:
+            reason = "piece not available" if piece_id not in self.my_pieces \
+                else "peer is choked" if address not in self.unchoked_peers \
+                else "peer not interested"
+            logging.debug(f"Rejected piece request {piece_id} from {address}: {reason}")
+
     def download_pieces(self) -> None:
         """Queue pieces for download based on strategy"""
-        if not self.available_pieces or not self.piece_manager:
+        if not self.peer_pieces or not self.piece_manager:
             return
         
         # Get list of needed pieces from piece manager
@@ -598,31 +986,32 @@ class Node:
         # Mark piece as in progress in piece manager
         if not self.piece_manager.mark_piece_in_progress(piece_id):
             return False
+        self._schedule_timeout(piece_id)
         
-        # Add to request queue with priority (lower number = higher priority)
-        priority = time.time()  # Simple FIFO priority
-        self.request_queue.put((priority, piece_id))
+        # Add to request queue with the next ticket (lower number = higher priority, FIFO otherwise)
+        self._push_piece_request(next(self._rq_ticket), piece_id)
         return True
     
-    def _select_peer_for_piece(self, piece_id: int) -> Optional[str]:
+    def _select_peer_for_piece(self, piece_id: int, exclude=()) -> Optional[str]:
         """
         Select a peer that has the piece we want.
         
         Args:
             piece_id: ID of the piece to request
+            exclude: peers not to pick, e.g. those with a full request pipeline
             
         Returns:
             Optional[str]: Address of selected peer or None if no suitable peer
         """
-        with self.lock:
-            suitable_peers = [
-                address 
-                for address, pieces in self.peer_pieces.items()
-                if (piece_id in pieces and
-                    address in self.peer_connections and
-                    address in self.unchoked_peers)
-            ]
-            return random.choice(suitable_peers) if suitable_peers else None
+        # Only the peers owning the piece are looked at, not the whole swarm
+        with self._pieces_lock, self._peers_lock:
+            owners = self._piece_owners.get(piece_id)
+            if not owners:
+                return None
+            candidates = owners & self.unchoked_peers & self.peer_connections.keys()
+            if exclude:
+                candidates -= exclude
+        return random.choice(tuple(candidates)) if candidates else None
 
     def transition_state(self, state_type: NodeStateType):
         """
@@ -659,7 +1048,7 @@ class Node:
 
     def announce_completion_to_tracker(self):
         if self.tracker_connection:
-            update_msg = MessageFactory.update_pieces(list(self.my_pieces))
+            update_msg = MessageFactory.bitfield(self._packed_pieces())
             self.tracker_connection.send(update_msg)
 
     def announce_stopping_to_tracker(self):
@@ -678,10 +1067,4 @@ class Node:
         if peer_address in self.peer_connections:
             request_msg = MessageFactory.piece_request(piece_id)
             self.peer_connections[peer_address].send(request_msg)
-
-            # Track the request
-            with self.lock:
-                self.pending_requests[piece_id] = {
-                    'peer': peer_address,
-                    'timestamp': time.time()
-                }
\ No newline at end of file
+            self._track_pending_requests([piece_id], peer_address)
\ No newline at end of file
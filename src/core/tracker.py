@@ -6,6 +6,7 @@ import logging
 import threading
 from src.network.messages import Message, MessageFactory
 from src.network.connection import SocketWrapper
+from src.torrent.bitfield import Bitfield
 from src.config import *
 
 class Subject:
@@ -28,7 +29,7 @@ class Tracker(Subject):
         self.host = host
         self.port = port
         self.socket = None
-        self.active_peers = {} # {address: {last_seen: timestampe, pieces: [pieces_ids]}}
+        self.active_peers = {} # {address: {last_seen: timestampe, pieces: [pieces_ids], piece_set: set(pieces_ids)}}
         self.lock = threading.RLock()
         self._running = False
 
@@ -98,14 +99,18 @@ class Tracker(Subject):
                     logging.error(f"Buffer overflow from {peer_address}, closing connection")
                     break
                     
-                # Process message
-                try:
-                    message = Message.deserialize(bytes(buffer))
-                    buffer.clear()
+                # Process every complete message, one read may carry several
+                while buffer:
+                    try:
+                        message, consumed = Message.parse_json(buffer)
+                    except ValueError:
+                        logging.warning(f"Invalid message from {peer_address}, discarding buffered data")
+                        buffer.clear()
+                        break
+                    if message is None:
+                        break # wait for the rest of the message
+                    del buffer[:consumed]
                     self._process_message(message, client_socket, address)
-                except ValueError:
-                    # Incomplete message, wait for more data
-                    pass
 
         except Exception as e:
             logging.error(f"Error handling client {peer_address}: {e}!", exc_info=True)
@@ -128,18 +133,33 @@ class Tracker(Subject):
 
         elif message.msg_type == "update_pieces":
             # Use the registered address instead of connection address
-            self.connection_address_map = getattr(self, 'connection_address_map', {})
-            registered_address = self.connection_address_map.get(
-                self._format_address(address), address)
-                
+            registered_address = self._registered_address(address)
             pieces = message.payload.get("pieces", [])
             self.update_peer_pieces(registered_address, pieces)
 
+        elif message.msg_type == "bitfield":
+            registered_address = self._registered_address(address)
+            try:
+                packed = bytes.fromhex(message.payload.get("bitfield", ""))
+            except ValueError:
+                logging.warning(f"Invalid bitfield from {self._format_address(address)}")
+                return
+            self.update_peer_pieces(registered_address, list(Bitfield.from_bytes(packed)))
+
+        elif message.msg_type == "have":
+            registered_address = self._registered_address(address)
+            self.add_peer_piece(registered_address, message.payload.get("piece_id"))
+
         elif message.msg_type == "get_peers":
             peers = self.get_all_peers()
             response = MessageFactory.peer_list(peers)
             client_socket.sendall(response)
 
+    def _registered_address(self, address) -> str:
+        """Address the peer registered with, falling back to the connection address."""
+        self.connection_address_map = getattr(self, 'connection_address_map', {})
+        return self.connection_address_map.get(self._format_address(address), address)
+
     def _check_peer_health(self):
         """Check and remove inactive peers periodically"""
         while self._running:
@@ -175,7 +195,8 @@ class Tracker(Subject):
             std_address = self._format_address(address)
             self.active_peers[std_address] = {
                 "last_seen": time.time(),
-                "pieces": [] # Peer has no pieces initially
+                "pieces": [], # Peer has no pieces initially
+                "piece_set": set() # same pieces, for O(1) de-duplication of have messages
             }
             self.notify({
                 "type": "peer_joined", 
@@ -190,10 +211,27 @@ class Tracker(Subject):
             peer_address = self._format_address(address)
             if peer_address in self.active_peers:
                 self.active_peers[peer_address]["pieces"] = pieces
+                self.active_peers[peer_address]["piece_set"] = set(pieces)
                 self.active_peers[peer_address]["last_seen"] = time.time()
             else:
                 logging.warning(f"Peer address {peer_address} not found in active_peers during piece update.")
 
+    def add_peer_piece(self, address, piece_id: int) -> None:
+        """Record one newly completed piece of a peer."""
+        if not isinstance(piece_id, int) or piece_id < 0:
+            logging.warning(f"Ignored have with invalid piece id {piece_id!r} from {self._format_address(address)}")
+            return
+        with self.lock:
+            peer_address = self._format_address(address)
+            info = self.active_peers.get(peer_address)
+            if info is None:
+                logging.warning(f"Peer address {peer_address} not found in active_peers during piece update.")
+                return
+            if piece_id not in info["piece_set"]:
+                info["piece_set"].add(piece_id)
+                info["pieces"].append(piece_id)
+            info["last_seen"] = time.time()
+
     def get_all_peers(self) -> list[dict[str, list[int]]]:
         """Get a list of all active peers and their pieces."""
         with self.lock:
@@ -1,18 +1,38 @@
 # src/network/connection.py
+import os
 import time
 import queue
 import socket
+import logging
 import threading
-from typing import Callable, Optional, List, Dict, Any
-from src.network.messages import Message
+from typing import Callable, Optional, List, Dict, Any, NamedTuple
+from src.network.messages import Message, MessageFactory, PIECE_FRAME_MAGIC
+from src.config import *
+
+def tune_socket_buffers(sock: socket.socket) -> None:
+    """Size the kernel buffers of a TCP socket, set before connect() so the window scale covers them."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
+    except OSError as e:
+        logging.warning(f"Could not set socket buffer sizes: {e}")
+
+class FileRegion(NamedTuple):
+    """Queued piece frame whose data is sent straight from a file, the fd is owned by the queue."""
+    header: bytes
+    fd: int
+    offset: int
+    length: int
 
 class ConnectionHandler:
     def __init__(self):
         self.read_buffer = bytearray()
-        self.write_queue = queue.Queue()
+        self.write_queue = queue.Queue(maxsize=SEND_QUEUE_MAX_SIZE)
         self.callbacks = []
         self.lock = threading.RLock()
+        self._send_lock = threading.Lock() # orders send() against stop() so nothing is queued after the drain
         self._running = False
+        self._closed = False
 
     def register_callback(self, callback: Callable[[Message], None]) -> None:
         """
@@ -24,27 +44,49 @@ class ConnectionHandler:
         with self.lock:
             self.callbacks.append(callback)
 
-    def send(self, message: bytes) -> None:
-        """Queue a message to be sent"""
-        self.write_queue.put(message)
+    def send(self, message: bytes) -> bool:
+        """
+            Queue a message to be sent, never waits.
+
+            Args:
+                message(bytes): serialized message
+
+            Returns:
+                bool: False if the handler is stopped or the queue is full
+        """
+        with self._send_lock:
+            if self._closed:
+                return False
+            try:
+                self.write_queue.put_nowait(message)
+                return True
+            except queue.Full:
+                return False
 
     def _process_read_buffer(self) -> None:
         """Process the read buffer and emit message_received events."""
         with self.lock:
-            # In real-world implementation, we would need a message framing protocol
-            # This is simplified
-            try:
-                if self.read_buffer:
-                    message = Message.deserialize(bytes(self.read_buffer))
+            # Piece frames carry their length and JSON messages end with their
+            # closing brace, so several of either can share one read
+            while self.read_buffer:
+                try:
+                    if self.read_buffer[:1] == PIECE_FRAME_MAGIC:
+                        message, consumed = Message.parse_piece_frame(self.read_buffer)
+                    else:
+                        message, consumed = Message.parse_json(self.read_buffer)
+                except ValueError:
+                    # The stream can't be resynchronised after invalid data
                     self.read_buffer.clear()
+                    return
+                if message is None:
+                    return # wait for the rest of the message
+                del self.read_buffer[:consumed]
+                self._notify(message)
 
-                    # Notify all registered callbacks
-                    for callback in self.callbacks:
-                        callback(message)
-            except ValueError as e:
-                # Message not complete or invalid, in that case,
-                # we wait for more data
-                pass
+    def _notify(self, message: Message) -> None:
+        """Notify all registered callbacks."""
+        for callback in self.callbacks:
+            callback(message)
 
     def handle_received_data(self, data: bytes) -> None:
         """Add received data to the read buffer and process it."""
@@ -52,16 +94,20 @@ class ConnectionHandler:
             self.read_buffer.extend(data)
             self._process_read_buffer()
 
-    def get_next_message(self) -> Optional[bytes]:
-        """Get the next message from the queue if available."""
+    def get_next_message(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Get the next message from the queue, waiting up to timeout seconds if given."""
         try:
-            return self.write_queue.get_nowait()
+            if timeout is None:
+                return self.write_queue.get_nowait()
+            return self.write_queue.get(timeout=timeout)
         except queue.Empty:
             return None
         
     def stop(self) -> None:
-        """Stop the connection handler."""
-        self._running = False
+        """Stop the connection handler, later sends are rejected."""
+        with self._send_lock:
+            self._running = False
+            self._closed = True
 
 
 class SocketWrapper:
@@ -88,6 +134,7 @@ class SocketWrapper:
         while retries < self.max_retries:
             try:
                 self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                tune_socket_buffers(self.socket)
                 self.socket.settimeout(self.connect_timeout)
                 self.socket.connect((self.host, self.port))
                 self.socket.settimeout(None) # Set to blocking mode for read/write operations
@@ -135,23 +182,53 @@ class SocketWrapper:
     def _write_loop(self) -> None:
         """Write loop sending queue messages."""
         while self._running and self.socket:
-            message = self.handler.get_next_message()
+            # Block until a message is queued, waking now and then to notice a close
+            message = self.handler.get_next_message(timeout=0.5)
             if message:
                 try:
-                    self.socket.sendall(message)
-                except (socket.error, OSError):
+                    if isinstance(message, FileRegion):
+                        self._send_file_region(message)
+                    else:
+                        self.socket.sendall(message)
+                except (socket.error, OSError, AttributeError):
                     break
-            else:
-                # No message to send, sleep to avoid CPU spin
-                time.sleep(0.01)
 
         self._cleanup()
 
+    def _send_file_region(self, region: FileRegion) -> None:
+        """Send a frame header then let the kernel copy the file region to the socket."""
+        try:
+            self.socket.sendall(region.header)
+            out_fd = self.socket.fileno()
+            offset, end = region.offset, region.offset + region.length
+            while offset < end:
+                try:
+                    sent = os.sendfile(out_fd, region.fd, offset, end - offset)
+                except OSError:
+                    if offset != region.offset:
+                        raise
+                    # sendfile unsupported for this pair, copy through user space once
+                    self.socket.sendall(os.pread(region.fd, region.length, region.offset))
+                    return
+                if sent == 0:
+                    raise OSError(f"File ended before the piece region at offset {offset}")
+                offset += sent
+        finally:
+            os.close(region.fd)
+
     def _cleanup(self) -> None:
         """Clean up resources when connection ends."""
         self._running = False
         self.handler.stop()
 
+        # Release the file descriptors of pieces that will never be sent
+        while True:
+            message = self.handler.get_next_message()
+            if message is None:
+                break
+            if isinstance(message, FileRegion):
+                os.close(message.fd)
+
         if self.socket:
             try:
                 self.socket.close()
@@ -160,9 +237,49 @@ class SocketWrapper:
             finally:
                 self.socket = None
 
-    def send(self, message: bytes) -> None:
-        """Send a messsage through the connection handler."""
-        self.handler.send(message)
+    def send(self, message: bytes, droppable: bool = False) -> bool:
+        """
+        Queue a messsage for the writer thread without blocking.
+
+        Args:
+            message(bytes): serialized message
+            droppable(bool): the message may be lost when the queue is full, for
+                messages a later one makes redundant (e.g. have). Otherwise a full
+                queue means the peer stopped reading and the connection is dropped.
+
+        Returns:
+            bool: False if the message was not queued
+        """
+        if self.handler.send(message):
+            return True
+        if not droppable and self._running:
+            self._abort()
+        return False
+
+    def _abort(self) -> None:
+        """Shut the socket down from any thread, the loops exit and clean up."""
+        self._running = False
+        self.handler.stop()
+        sock = self.socket
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def send_piece_zerocopy(self, piece_id: int, fd: int, offset: int, length: int) -> None:
+        """
+        Queue a piece to be sent from a file region without copying it into Python.
+
+        Args:
+            piece_id(int): the id of the piece
+            fd(int): file descriptor holding the piece, closed by the connection once sent
+            offset(int): position of the piece in the file
+            length(int): size of the piece
+        """
+        header = MessageFactory.piece_frame_header(piece_id, length)
+        if not self.send(FileRegion(header, fd, offset, length)):
+            os.close(fd)
 
     def register_callback(self, callback: Callable[[Message], None]) -> None:
         """Register a callback for received messages."""
@@ -1,6 +1,17 @@
 # src/network/messages.py
 import json
-from typing import Dict, List, Any, Optional
+import struct
+from typing import Dict, List, Any, Optional, Tuple
+
+PROTOCOL_VERSION = 2
+
+# Piece data travels as a binary frame instead of hex inside JSON:
+# magic, protocol version, piece id, data length, then the raw data.
+# JSON messages always start with '{' so the magic byte tells them apart.
+PIECE_FRAME_MAGIC = b'\x00'
+PIECE_FRAME_HEADER = struct.Struct('>cBIQ')
+
+_JSON_DECODER = json.JSONDecoder()
 
 class Message:
     """Base Message class with serialization hooks."""
@@ -8,8 +19,11 @@ class Message:
         "peer_joined",
         "peer_list",
         "piece_request",
+        "piece_request_batch",
         "piece_response",
         "update_pieces",
+        "have",
+        "bitfield",
         "get_peers",
         "cancel_request",
         "stopped",
@@ -55,22 +69,11 @@ class Message:
         Raises:
             ValueError: if data is complete but invalid
         """
+        if data[:1] == PIECE_FRAME_MAGIC:
+            return cls.parse_piece_frame(data)[0]
+
         try:
-            decoded = json.loads(data.decode('utf-8'))
-            
-            # Validate message structure
-            if not isinstance(decoded, dict):
-                raise ValueError("Invalid message: not a dictionary!")
-            
-            if "type" not in decoded or "payload" not in decoded:
-                raise ValueError("Invalid message: missing type or payload")
-            
-            # Validate message type
-            msg_type = decoded["type"]
-            if msg_type not in cls.VALID_TYPES:
-                raise ValueError(f"Invalid message type: {msg_type}")
-            
-            return cls(msg_type, decoded["payload"])
+            return cls._from_decoded(json.loads(data.decode('utf-8')))
         
         except json.JSONDecodeError as e:
             # Check if this is an incomplete message
@@ -78,6 +81,87 @@ class Message:
                 return None  # Signal incomplete data
             # Otherwise it's malformed JSON, not just incomplete
             raise ValueError("Failed to decode the message: invalid JSON!")
+
+    @classmethod
+    def _from_decoded(cls, decoded: Any) -> 'Message':
+        """Build a message from decoded JSON, validating its structure."""
+        if not isinstance(decoded, dict):
+            raise ValueError("Invalid message: not a dictionary!")
+        
+        if "type" not in decoded or "payload" not in decoded:
+            raise ValueError("Invalid message: missing type or payload")
+        
+        # Validate message type
+        msg_type = decoded["type"]
+        if msg_type not in cls.VALID_TYPES:
+            raise ValueError(f"Invalid message type: {msg_type}")
+        
+        return cls(msg_type, decoded["payload"])
+
+    @classmethod
+    def parse_json(cls, data: bytes) -> Tuple[Optional['Message'], int]:
+        """
+        Parse the JSON message at the start of data, more messages may follow it.
+
+        Args:
+            data(bytes): buffer starting with a JSON message
+
+        Returns:
+            Tuple[Optional[Message], int]: the message and the number of bytes it
+                used, or (None, 0) if the message isn't complete yet
+
+        Raises:
+            ValueError: if the message is invalid
+        """
+        # JSON escapes control characters, so a NUL byte can only start a piece frame
+        frame_start = data.find(PIECE_FRAME_MAGIC)
+        segment = data if frame_start == -1 else data[:frame_start]
+        try:
+            text = segment.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # A multi-byte character may be cut at the end of what arrived so far
+            if frame_start != -1 or len(segment) - e.start > 3:
+                raise ValueError("Failed to decode the message: invalid UTF-8!")
+            text = segment[:e.start].decode('utf-8')
+
+        try:
+            decoded, end = _JSON_DECODER.raw_decode(text)
+        except json.JSONDecodeError as e:
+            incomplete = e.pos >= len(text) or "Unterminated string" in e.msg
+            if frame_start == -1 and incomplete:
+                return None, 0
+            raise ValueError("Failed to decode the message: invalid JSON!")
+
+        return cls._from_decoded(decoded), len(text[:end].encode('utf-8'))
+
+    @classmethod
+    def parse_piece_frame(cls, data: bytes) -> Tuple[Optional['Message'], int]:
+        """
+        Parse a binary piece frame from the start of data.
+
+        Args:
+            data(bytes): buffer starting with PIECE_FRAME_MAGIC
+
+        Returns:
+            Tuple[Optional[Message], int]: the piece_response message and the number
+                of bytes it used, or (None, 0) if the frame isn't complete yet
+
+        Raises:
+            ValueError: if the frame has an unsupported protocol version
+        """
+        if len(data) < PIECE_FRAME_HEADER.size:
+            return None, 0
+
+        _, version, piece_id, length = PIECE_FRAME_HEADER.unpack_from(data)
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f"Unsupported piece frame version: {version}")
+
+        end = PIECE_FRAME_HEADER.size + length
+        if len(data) < end:
+            return None, 0
+
+        payload = {"piece_id": piece_id, "data": bytes(data[PIECE_FRAME_HEADER.size:end])}
+        return cls("piece_response", payload), end
         
 class MessageFactory:
     """Factory for creating different types of network messages."""
@@ -135,6 +219,20 @@ class MessageFactory:
         message = Message("piece_request", {"piece_id": piece_id})
         return message.serialize()
     
+    @staticmethod
+    def piece_request_batch(piece_ids: List[int]) -> bytes:
+        """
+        Create a message requesting several pieces from the same peer at once.
+
+        Args:
+            piece_ids(List[int]): ids of the pieces to request
+
+        Returns:
+            bytes: serialized message
+        """
+        message = Message("piece_request_batch", {"piece_ids": list(piece_ids)})
+        return message.serialize()
+    
     @staticmethod
     def piece_response(piece_id: int, data: bytes) -> bytes:
         """
@@ -153,6 +251,34 @@ class MessageFactory:
         })
         return message.serialize()
     
+    @staticmethod
+    def piece_response_binary(piece_id: int, data: bytes) -> bytes:
+        """
+        Create a binary frame carrying raw piece data in response to a request.
+
+        Args:
+            piece_id(int): the id of the piece
+            data(bytes): the piece data
+
+        Returns:
+            bytes: the framed message
+        """
+        return MessageFactory.piece_frame_header(piece_id, len(data)) + data
+
+    @staticmethod
+    def piece_frame_header(piece_id: int, length: int) -> bytes:
+        """
+        Create the header of a binary piece frame, for data sent separately.
+
+        Args:
+            piece_id(int): the id of the piece
+            length(int): size of the piece data that follows
+
+        Returns:
+            bytes: the frame header
+        """
+        return PIECE_FRAME_HEADER.pack(PIECE_FRAME_MAGIC, PROTOCOL_VERSION, piece_id, length)
+    
     @staticmethod
     def update_pieces(pieces: List[int]) -> bytes:
         """
@@ -167,6 +293,34 @@ class MessageFactory:
         message = Message("update_pieces", {"pieces": pieces})
         return message.serialize()
     
+    @staticmethod
+    def have(piece_id: int) -> bytes:
+        """
+        Create a message announcing a single newly completed piece.
+
+        Args:
+            piece_id(int): id of the completed piece
+
+        Returns:
+            bytes: serialized message
+        """
+        message = Message("have", {"piece_id": piece_id})
+        return message.serialize()
+    
+    @staticmethod
+    def bitfield(packed: bytes) -> bytes:
+        """
+        Create a message carrying every piece a peer has as a packed bitfield.
+
+        Args:
+            packed(bytes): bit (i & 7) of byte (i >> 3) set for each piece i
+
+        Returns:
+            bytes: serialized message
+        """
+        message = Message("bitfield", {"bitfield": packed.hex()})
+        return message.serialize()
+    
     @staticmethod
     def cancel_request(piece_id: int) -> bytes:
         """
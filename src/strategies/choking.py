@@ -1,5 +1,6 @@
 # src/strategies/choking.py
 import time
+import heapq
 import random
 from typing import List, Set, Dict
 
@@ -37,11 +38,11 @@ class OptimisticUnchokeStrategy(ChokingStrategy):
                 self.optimistic_unchoked = random.choice(all_peers)
                 self.last_rotation = current_time
 
-        # Sort peers by download rate (descending)
-        sorted_peers = sorted(
+        # Top performers by download rate (descending), enough to fill every slot
+        sorted_peers = heapq.nlargest(
+            max_unchoked,
             peer_stats.items(),
-            key=lambda x: x[1].get('download_rate', 0),
-            reverse=True
+            key=lambda x: x[1].get('download_rate', 0)
         )
 
         unchoked_peers = set()
@@ -85,13 +86,13 @@ class TitForTatStrategy(ChokingStrategy):
         Returns:
             Set[str]: set of peer addresses to unchoke
         """
-        sorted_peers = sorted(
+        top_peers = heapq.nlargest(
+            max_unchoked,
             peer_stats.items(),
-            key=lambda x: x[1].get('download_rate', 0),
-            reverse=True
+            key=lambda x: x[1].get('download_rate', 0)
         )
 
-        return {peer for peer, _ in sorted_peers[:max_unchoked]}
+        return {peer for peer, _ in top_peers}
     
 
 class UploadSlotManager:
@@ -0,0 +1,110 @@
+# src/torrent/bitfield.py
+from typing import Iterable, Iterator, Optional
+
+# Set bit positions of every byte value, so packing and iteration work a byte at a time
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+_BIT_MASKS = tuple(1 << bit for bit in range(8))
+
+class Bitfield:
+    """
+    Compact set of piece indices backed by a bytearray, one bit per piece.
+    Supports the subset of the set interface the node uses for its pieces.
+    """
+
+    def __init__(self, size: int, fill: bool = False):
+        """
+        Initialize the bitfield.
+
+        Args:
+            size(int): number of pieces the bitfield covers
+            fill(bool): mark every piece as present
+        """
+        self.size = size
+        self.bits = bytearray((size + 7) >> 3)
+        self.count = 0
+
+        if fill and size:
+            self.bits[:] = b'\xff' * len(self.bits)
+            # Clear the padding bits past the last piece
+            if size & 7:
+                self.bits[-1] = (1 << (size & 7)) - 1
+            self.count = size
+
+    @classmethod
+    def from_pieces(cls, size: int, pieces: Iterable[int]) -> 'Bitfield':
+        """Build a bitfield with the given piece indices set."""
+        bitfield = cls(size)
+        pieces = pieces if isinstance(pieces, (set, frozenset, list, tuple)) else list(pieces)
+        if not pieces:
+            return bitfield
+        if min(pieces) < 0 or max(pieces) >= size:
+            raise IndexError(f"Piece out of range for a bitfield of {size} pieces")
+
+        # Set the bits in one tight loop, then count them all at once
+        bits, masks = bitfield.bits, _BIT_MASKS
+        for piece_id in pieces:
+            bits[piece_id >> 3] |= masks[piece_id & 7]
+        bitfield.count = int.from_bytes(bits, 'little').bit_count()
+        return bitfield
+
+    @classmethod
+    def from_bytes(cls, data: bytes, size: Optional[int] = None) -> 'Bitfield':
+        """
+        Build a bitfield from its packed form, as produced by to_bytes.
+
+        Args:
+            data(bytes): packed bits, bit (i & 7) of byte (i >> 3) is piece i
+            size(Optional[int]): number of pieces, every bit of data if omitted
+        """
+        bitfield = cls(len(data) * 8 if size is None else size)
+        bitfield.bits[:] = data[:len(bitfield.bits)].ljust(len(bitfield.bits), b'\x00')
+        # Clear the padding bits past the last piece
+        if bitfield.size & 7:
+            bitfield.bits[-1] &= (1 << (bitfield.size & 7)) - 1
+        bitfield.count = int.from_bytes(bitfield.bits, 'little').bit_count()
+        return bitfield
+
+    def to_bytes(self) -> bytes:
+        """Packed bits, bit (i & 7) of byte (i >> 3) is piece i."""
+        return bytes(self.bits)
+
+    def add(self, piece_id: int) -> None:
+        """Mark a piece as present."""
+        if not 0 <= piece_id < self.size:
+            raise IndexError(f"Piece {piece_id} out of range")
+        mask = 1 << (piece_id & 7)
+        if not self.bits[piece_id >> 3] & mask:
+            self.bits[piece_id >> 3] |= mask
+            self.count += 1
+
+    def discard(self, piece_id: int) -> None:
+        """Mark a piece as missing, ignoring out of range ids."""
+        if piece_id in self:
+            self.bits[piece_id >> 3] &= ~(1 << (piece_id & 7)) & 0xff
+            self.count -= 1
+
+    def __contains__(self, piece_id) -> bool:
+        if not isinstance(piece_id, int) or not 0 <= piece_id < self.size:
+            return False
+        return bool((self.bits[piece_id >> 3] >> (piece_id & 7)) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        byte_bits = _BYTE_BITS
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                base = byte_index << 3
+                for bit in byte_bits[byte]:
+                    yield base + bit
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Bitfield):
+            return self.size == other.size and self.bits == other.bits
+        if isinstance(other, (set, frozenset)):
+            return len(other) == self.count and all(piece_id in self for piece_id in other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Bitfield(size={self.size}, count={self.count})"
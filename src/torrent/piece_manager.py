@@ -2,7 +2,7 @@
 import os
 import hashlib
 import threading
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import time
 
 class PieceManager:
@@ -96,7 +96,7 @@ class PieceManager:
             if piece_id in self.in_progress_pieces or piece_id in self.completed_pieces:
                 return False
                 
-            self.in_progress_pieces[piece_id] = time.time()
+            self.in_progress_pieces[piece_id] = time.monotonic()
             return True
     
     def receive_piece(self, piece_id: int, data: bytes) -> bool:
@@ -130,6 +130,26 @@ class PieceManager:
             self.file_handle.seek(offset)
             return self.file_handle.read(self.piece_size)
     
+    def get_piece_region(self, piece_id: int) -> Optional[Tuple[int, int, int]]:
+        """
+        Locate a completed piece in the output file, for sending it without reading it.
+        
+        Args:
+            piece_id (int): ID of the piece
+            
+        Returns:
+            Optional[Tuple[int, int, int]]: File descriptor, offset and length of the piece.
+                The descriptor is a duplicate that stays valid after close_storage(),
+                the caller must close it.
+        """
+        with self.lock:
+            if piece_id not in self.completed_pieces or not self.file_handle:
+                return None
+            self.file_handle.flush()
+            offset = piece_id * self.piece_size
+            length = min(self.piece_size, self.total_size - offset)
+            return os.dup(self.file_handle.fileno()), offset, length
+    
     def _verify_and_save_piece(self, piece_id: int) -> None:
         """
         Verify a piece's hash and save it to disk if valid.
@@ -181,6 +201,24 @@ class PieceManager:
         except IOError as e:
             print(f"Failed to write piece {piece_id} to disk: {e}")
             
+    def expire_in_progress(self, piece_id: int, timeout_secs: int = 60) -> bool:
+        """
+        Release a piece that has been in progress for too long.
+        
+        Args:
+            piece_id (int): ID of the piece
+            timeout_secs (int): Number of seconds after which a piece is considered timed out
+            
+        Returns:
+            bool: True if the piece had timed out and was released for re-requesting
+        """
+        with self.lock:
+            start_time = self.in_progress_pieces.get(piece_id)
+            if start_time is None or time.monotonic() - start_time < timeout_secs:
+                return False
+            del self.in_progress_pieces[piece_id]
+            return True
+    
     def check_timeouts(self, timeout_secs: int = 60) -> List[int]:
         """
         Check for timed-out pieces and return them for re-requesting.
@@ -191,7 +229,7 @@ class PieceManager:
         Returns:
             List[int]: List of piece IDs that have timed out
         """
-        current_time = time.time()
+        current_time = time.monotonic()
         timed_out = []
         
         with self.lock:
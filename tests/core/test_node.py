@@ -1,10 +1,16 @@
 # tests/core/test_node.py
+import os
 import time
+import heapq
 import socket
 import unittest
+import threading
 from unittest.mock import MagicMock, patch
 
+from src.core import node as node_module
 from src.core.node import Node
+from src.network.messages import Message, MessageFactory
+from src.torrent.bitfield import Bitfield
 from src.torrent.piece_manager import PieceManager
 from src.states.seeder_state import SeederState
 
@@ -19,11 +25,6 @@ class TestNode(unittest.TestCase):
         
         # Mock pieces
         self.node.piece_availability = {0: 2, 1: 1, 2: 3}
-        self.node.available_pieces = [
-            {"id": 0, "availability": 2},
-            {"id": 1, "availability": 1},
-            {"id": 2, "availability": 3}
-        ]
 
     def test_configure_piece_manager(self):
         """Test configuration of piece manager"""
@@ -53,7 +54,20 @@ class TestNode(unittest.TestCase):
         # Verify
         self.assertTrue(result)
         self.mock_piece_manager.mark_piece_in_progress.assert_called_once_with(1)
-        self.assertEqual(self.node.request_queue.qsize(), 1)
+        self.assertEqual(len(self.node._rq_heap), 1)
+
+    def test_queue_order_and_timeout_requeue(self):
+        """Pieces are served in queueing order, timed out ones first"""
+        self.mock_piece_manager.mark_piece_in_progress.return_value = True
+        for piece_id in (5, 3, 4):
+            self.node._queue_piece_request(piece_id)
+        self.node._track_pending_requests([7], 'peer1', time.monotonic() - 70)
+        self.mock_piece_manager.expire_in_progress.return_value = False
+
+        self.node._process_timeout_checks()
+
+        order = [heapq.heappop(self.node._rq_heap)[1] for _ in range(len(self.node._rq_heap))]
+        self.assertEqual(order, [7, 5, 3, 4])
         
     def test_queue_piece_request_already_in_progress(self):
         """Test requesting a piece that's already in progress"""
@@ -65,8 +79,116 @@ class TestNode(unittest.TestCase):
         
         # Verify
         self.assertFalse(result)
-        self.assertEqual(self.node.request_queue.qsize(), 0)
-        
+        self.assertEqual(len(self.node._rq_heap), 0)
+        
+    def test_process_request_queue_wakes_on_new_piece(self):
+        """Test a queued piece is dispatched without waiting for a poll interval"""
+        connection = MagicMock()
+        self.node.peer_connections = {'peer1': connection}
+        self.node.unchoked_peers = {'peer1'}
+        self.node._update_piece_availability([{"address": "peer1", "pieces": [1]}])
+        self.mock_piece_manager.mark_piece_in_progress.return_value = True
+        self.node.running = True
+        worker = threading.Thread(target=self.node._process_request_queue, daemon=True)
+        worker.start()
+
+        self.node._queue_piece_request(1)
+        deadline = time.time() + 1.0
+        while 1 not in self.node.pending_requests and time.time() < deadline:
+            time.sleep(0.005)
+        self.node.running = False
+        worker.join(timeout=2.0)
+
+        self.assertEqual(self.node.pending_requests[1]['peer'], 'peer1')
+        connection.send.assert_called_once()
+
+    @patch('src.core.node.MAX_PER_PEER_PIPELINE', 2)
+    def test_process_request_queue_caps_requests_per_peer(self):
+        """Test a peer with a full pipeline gets no more requests"""
+        self.node.peer_connections = {'peer1': MagicMock(), 'peer2': MagicMock()}
+        self.node.unchoked_peers = {'peer1', 'peer2'}
+        self.node._update_piece_availability([
+            {"address": "peer1", "pieces": [0, 1, 2]},
+            {"address": "peer2", "pieces": [0, 1, 2]}
+        ])
+        self.node._track_pending_requests([10, 11], 'peer1')
+        for piece_id in (0, 1, 2):
+            self.node._push_piece_request(piece_id, piece_id)
+        self.node.running = True
+        worker = threading.Thread(target=self.node._process_request_queue, daemon=True)
+        worker.start()
+
+        deadline = time.time() + 1.0
+        while len(self.node.pending_requests) < 4 and time.time() < deadline:
+            time.sleep(0.005)
+        self.node.running = False
+        worker.join(timeout=2.0)
+
+        self.assertEqual(dict(self.node._outstanding_per_peer), {'peer1': 2, 'peer2': 2})
+        self.assertEqual([piece_id for _, piece_id in self.node._rq_heap], [2])
+        self.node.peer_connections['peer1'].send.assert_not_called()
+
+    def test_process_request_queue_batches_per_peer(self):
+        """Test pieces bound for the same peer go out in one message"""
+        connection = MagicMock()
+        self.node.peer_connections = {'peer1': connection}
+        self.node.unchoked_peers = {'peer1'}
+        self.node._update_piece_availability([{"address": "peer1", "pieces": [0, 1, 2]}])
+        for piece_id in (0, 1, 2):
+            self.node._push_piece_request(piece_id, piece_id)
+        self.node.running = True
+        worker = threading.Thread(target=self.node._process_request_queue, daemon=True)
+        worker.start()
+
+        deadline = time.time() + 1.0
+        while len(self.node.pending_requests) < 3 and time.time() < deadline:
+            time.sleep(0.005)
+        self.node.running = False
+        worker.join(timeout=2.0)
+
+        connection.send.assert_called_once()
+        sent = Message.deserialize(connection.send.call_args[0][0])
+        self.assertEqual(sent.msg_type, "piece_request_batch")
+        self.assertEqual(sorted(sent.payload["piece_ids"]), [0, 1, 2])
+
+    def test_update_peer_connections_connects_in_background(self):
+        self.node.address = "127.0.0.1:6000"
+        self.node.peer_connections["127.0.0.1:6001"] = MagicMock()
+        peers = [{"address": a} for a in ("127.0.0.1:6000", "127.0.0.1:6001", "127.0.0.1:6002")]
+
+        with patch.object(self.node, '_connect_pool') as mock_pool:
+            self.node._update_peer_connections(peers)
+            # A repeated peer list while the connect is in flight starts no second one
+            self.node._update_peer_connections(peers)
+
+        mock_pool.submit.assert_called_once_with(self.node._connect_to_peer, "127.0.0.1:6002")
+        self.assertEqual(self.node._connecting, {"127.0.0.1:6002"})
+
+    def test_tracker_heartbeat_skips_unchanged_bitfield(self):
+        self.node.running = True
+        self.node.my_pieces = {1}
+        self.node.tracker_connection = MagicMock()
+        sleeps = []
+
+        def fake_sleep(_):
+            sleeps.append(None)
+            if len(sleeps) == 2:
+                self.node.my_pieces.add(5)
+            elif len(sleeps) == 4:
+                self.node.running = False
+
+        with patch.object(node_module, 'TRACKER_HEARTBEAT_INTERVAL', 1), \
+             patch.object(node_module.time, 'sleep', side_effect=fake_sleep):
+            self.node._tracker_heartbeat()
+
+        sent = [Message.deserialize(call.args[0]) for call in self.node.tracker_connection.send.call_args_list]
+        self.assertEqual([msg.msg_type for msg in sent], ["bitfield", "bitfield"])
+
+    def _drain_disk_queue(self):
+        """Store the queued pieces like the disk writer thread does"""
+        while not self.node._disk_queue.empty():
+            self.node._store_piece(*self.node._disk_queue.get_nowait())
+
     def test_handle_piece_received(self):
         # Setup
         piece_id = 1
@@ -74,25 +196,29 @@ class TestNode(unittest.TestCase):
         
         # Mock pending request with new format
         self.node.pending_requests = {
-            piece_id: {'peer': 'peer1', 'timestamp': time.time()}
+            piece_id: {'peer': 'peer1', 'timestamp': time.monotonic()}
         }
         
         # Test
         self.node._handle_piece_received(piece_id, data)
         
-        # Verify
+        # Verify the piece waits for the disk writer
         self.assertNotIn(piece_id, self.node.pending_requests)
+        self.assertNotIn(piece_id, self.node.my_pieces)
+        self._drain_disk_queue()
         self.assertIn(piece_id, self.node.my_pieces)
+        self.mock_piece_manager.receive_piece.assert_called_once_with(piece_id, data)
 
     def test_transition_to_seeder(self):
         # Setup complete download
         self.node.piece_manager.is_complete = lambda: True
         self.node.pending_requests = {
-            1: {'peer': 'peer1', 'timestamp': time.time()}
+            1: {'peer': 'peer1', 'timestamp': time.monotonic()}
         }
         
         # Test
         self.node._handle_piece_received(1, b"data")
+        self._drain_disk_queue()
         
         # Verify state transition
         self.assertIsInstance(self.node.state, SeederState)
@@ -100,10 +226,10 @@ class TestNode(unittest.TestCase):
     def test_select_peer_for_piece(self):
         """Test selecting a peer that has a specific piece"""
         # Setup
-        self.node.peer_pieces = {
-            'peer2': {1, 2},
-            'peer3': {1, 3}
-        }
+        self.node._update_piece_availability([
+            {"address": "peer2", "pieces": [1, 2]},
+            {"address": "peer3", "pieces": [1, 3]}
+        ])
         self.node.peer_connections = {'peer2': MagicMock(), 'peer3': MagicMock()}
         self.node.unchoked_peers = {'peer2', 'peer3'}
         
@@ -116,11 +242,11 @@ class TestNode(unittest.TestCase):
     def test_select_peer_no_suitable_peer(self):
         """Test when no peer has the requested piece"""
         # Setup
-        self.node.peer_pieces = {
-            "peer1": {0, 2},
-            "peer2": {2},
-            "peer3": {0}
-        }
+        self.node._update_piece_availability([
+            {"address": "peer1", "pieces": [0, 2]},
+            {"address": "peer2", "pieces": [2]},
+            {"address": "peer3", "pieces": [0]}
+        ])
         self.node.unchoked_peers = {"peer1", "peer2", "peer3"}
         
         # Test
@@ -129,6 +255,22 @@ class TestNode(unittest.TestCase):
         # Verify
         self.assertIsNone(peer)
         
+    def test_select_peer_from_have_and_bitfield(self):
+        """Test pieces announced by connected peers make them selectable"""
+        self.node.peer_connections = {'peer1': MagicMock(), 'peer2': MagicMock()}
+        self.node.unchoked_peers = {'peer1', 'peer2'}
+        
+        self.node._handle_peer_message(Message.deserialize(MessageFactory.have(1)), 'peer1')
+        self.assertEqual(self.node._select_peer_for_piece(1), 'peer1')
+        self.assertEqual(self.node.piece_availability[1], 2)
+        
+        # A bitfield replaces what was known, the tracker list keeps connected peers
+        packed = Bitfield.from_pieces(3, [2]).to_bytes()
+        self.node._handle_peer_message(Message.deserialize(MessageFactory.bitfield(packed)), 'peer1')
+        self.node._update_piece_availability([])
+        self.assertIsNone(self.node._select_peer_for_piece(1))
+        self.assertEqual(self.node._select_peer_for_piece(2), 'peer1')
+
     def test_update_piece_availability(self):
         """Test updating piece availability from peer information"""
         # Setup
@@ -153,12 +295,50 @@ class TestNode(unittest.TestCase):
         self.assertEqual(self.node.peer_pieces["peer1"], {0, 2})
         self.assertEqual(self.node.peer_pieces["peer2"], {1, 2})
         self.assertEqual(self.node.peer_pieces["peer3"], {0, 1})
+
+    def test_update_piece_availability_applies_changes(self):
+        """Test a later peer list only adjusts the counts that changed"""
+        self.node.piece_availability = {0: 0, 1: 0, 2: 0}
+        self.node._update_piece_availability([
+            {"address": "peer1", "pieces": [0, 2]},
+            {"address": "peer2", "pieces": [1, 2]}
+        ])
+        
+        # peer1 gained piece 1 and lost piece 2, peer2 left the swarm
+        self.node._update_piece_availability([
+            {"address": "peer1", "pieces": [0, 1]}
+        ])
+        
+        self.assertEqual(self.node.piece_availability, {0: 1, 1: 1, 2: 0})
+        self.assertNotIn("peer2", self.node.peer_pieces)
+        self.node.my_pieces.add(0)
+        self.assertEqual(sorted(self.node.available_pieces), [(1, 1), (2, 0)])
+        self.assertEqual(self.node._piece_owners, {0: {"peer1"}, 1: {"peer1"}})
+
+    @patch('src.core.node.MAX_TRACKED_PEERS', 2)
+    def test_update_piece_availability_forgets_idle_peers(self):
+        """Test the least recently active peer is forgotten past the tracked peer limit"""
+        self.node.piece_availability = {0: 0, 1: 0, 2: 0}
+        self.node._update_piece_availability([
+            {"address": "peer1", "pieces": [0]},
+            {"address": "peer2", "pieces": [1]}
+        ])
+        # peer1 announces a piece, so peer2 is the least recently active
+        self.node._update_piece_availability([
+            {"address": "peer1", "pieces": [0, 2]},
+            {"address": "peer2", "pieces": [1]},
+            {"address": "peer3", "pieces": [2]}
+        ])
+        
+        self.assertEqual(list(self.node.peer_pieces), ["peer1", "peer3"])
+        self.assertEqual(self.node.piece_availability, {0: 1, 1: 0, 2: 2})
+        self.assertNotIn(1, self.node._piece_owners)
         
     # @patch('threading.Thread')
     # def test_check_request_timeouts(self, mock_thread):
     #     """Test checking for request timeouts"""
     #     # Setup
-    #     self.node.pending_requests = {1: time.time() - 70}  # 70 seconds old (timed out)
+    #     self.node.pending_requests = {1: time.monotonic() - 70}  # 70 seconds old (timed out)
     #     self.mock_piece_manager.check_timeouts.return_value = [2, 3]  # Pieces timed out in piece manager
         
     #     # Call the method directly instead of starting thread
@@ -168,7 +348,7 @@ class TestNode(unittest.TestCase):
     #         self.node.running = False
             
     #     # Verify timed out pieces are requeued (1 from pending_requests, 2 and 3 from piece manager)
-    #     self.assertGreaterEqual(self.node.request_queue.qsize(), 3)
+    #     self.assertGreaterEqual(len(self.node._rq_heap), 3)
         
     @patch('src.network.connection.SocketWrapper')
     def test_send_piece(self, mock_socket_wrapper):
@@ -177,29 +357,108 @@ class TestNode(unittest.TestCase):
         mock_connection = MagicMock()
         self.node.peer_connections = {"peer1": mock_connection}
         self.node.piece_manager = MagicMock()
+        self.node.piece_manager.get_piece_region.return_value = None
         self.node.piece_manager.get_piece_data.return_value = b'dummy_piece_data_1'  # Actual bytes
         
         # Test
         self.node._send_piece(1, "peer1")
         
-        # Verify
-        expected_data = b'dummy_piece_data_1'.hex()
+        # Verify the raw bytes are sent, not their hex encoding
         mock_connection.send.assert_called_once()
         args = mock_connection.send.call_args[0][0]
-        assert expected_data.encode() in args
+        self.assertIn(b'dummy_piece_data_1', args)
+        self.assertNotIn(b'dummy_piece_data_1'.hex().encode(), args)
+
+        # A second request for the piece reuses the built frame
+        self.node._send_piece(1, "peer1")
+        self.node.piece_manager.get_piece_data.assert_called_once_with(1)
+        self.assertIs(mock_connection.send.call_args[0][0], args)
+
+    @unittest.skipUnless(hasattr(os, 'sendfile'), "sendfile not available")
+    def test_send_piece_zerocopy(self):
+        """Test a piece on disk is handed to the connection as a file region"""
+        mock_connection = MagicMock()
+        self.node.peer_connections = {"peer1": mock_connection}
+        self.node.piece_manager = MagicMock()
+        self.node.piece_manager.get_piece_region.return_value = (7, 1024, 512)
+        
+        self.node._send_piece(2, "peer1")
+        
+        mock_connection.send_piece_zerocopy.assert_called_once_with(2, 7, 1024, 512)
+        mock_connection.send.assert_not_called()
+        self.node.piece_manager.get_piece_data.assert_not_called()
+
+    def test_accept_connections_without_delay(self):
+        """Test a burst of incoming connections is accepted right away"""
+        node = Node(listen_host='127.0.0.1', listen_port=0)
+        node.start()
+        clients = [socket.create_connection(('127.0.0.1', node.listen_port)) for _ in range(5)]
+        try:
+            deadline = time.time() + 0.4
+            while len(node.peer_connections) < 5 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(node.peer_connections), 5)
+        finally:
+            node.running = False
+            for client in clients:
+                client.close()
+            node.server_socket.close()
+
+    def test_start_runs_each_worker_once(self):
+        """Test start() launches the request processor and every other worker exactly once"""
+        node = Node(listen_host='127.0.0.1', listen_port=0)
+        with patch.object(node_module.threading, 'Thread') as mock_thread, \
+             patch.object(Node, 'discover_public_ip', return_value='127.0.0.1'):
+            node.start()
+        try:
+            targets = [call.kwargs['target'].__name__ for call in mock_thread.call_args_list]
+            self.assertIn('_process_request_queue', targets)
+            self.assertIn('_update_choking_state_periodically', targets)
+            self.assertEqual(len(targets), len(set(targets)))
+        finally:
+            node.running = False
+            node.server_socket.close()
 
     @patch('socket.socket')
     def test_discover_public_ip_fallback(self, mock_socket):
         """Test IP discovery falls back to local when STUN fails"""
-        mock_socket_instance = MagicMock()
-        mock_socket.return_value.__enter__.return_value = mock_socket_instance
-
         # Set the side effect for connect to simulate STUN failure
-        mock_socket_instance.connect.side_effect = socket.error
-        ip = self.node.discover_public_ip()
+        mock_socket.return_value.connect.side_effect = socket.error
+        with patch.dict(node_module._ip_cache, {"ip": None, "ts": 0.0}), \
+                patch.dict(node_module._stun_sockets, clear=True):
+            ip = self.node.discover_public_ip()
 
         self.assertEqual(ip, "127.0.0.1")
 
+    @patch('src.core.node._probe_stun_server')
+    def test_discover_public_ip_cached(self, mock_probe):
+        """Test the first STUN answer is cached for later calls"""
+        mock_probe.return_value = "203.0.113.7"
+        with patch.dict(node_module._ip_cache, {"ip": None, "ts": 0.0}):
+            self.assertEqual(self.node.discover_public_ip(), "203.0.113.7")
+            calls = mock_probe.call_count
+            self.assertEqual(self.node.discover_public_ip(), "203.0.113.7")
+            self.assertEqual(mock_probe.call_count, calls)
+
+    @patch('src.core.node._probe_stun_server')
+    def test_discover_public_ip_known_address(self, mock_probe):
+        """Test a node that already has an address skips discovery unless forced"""
+        mock_probe.return_value = "203.0.113.8"
+        self.node.address = "198.51.100.4:6881"
+        self.assertEqual(self.node.discover_public_ip(), "198.51.100.4")
+        mock_probe.assert_not_called()
+        with patch.dict(node_module._ip_cache, {"ip": None, "ts": 0.0}):
+            self.assertEqual(self.node.discover_public_ip(force=True), "203.0.113.8")
+
+    def test_probe_reuses_stun_socket(self):
+        """Test consecutive probes of a server share one UDP socket"""
+        with patch.dict(node_module._stun_sockets, clear=True):
+            node_module._probe_stun_server("127.0.0.1", 9)
+            sock = node_module._stun_sockets[("127.0.0.1", 9)]
+            node_module._probe_stun_server("127.0.0.1", 9)
+            self.assertIs(node_module._stun_sockets[("127.0.0.1", 9)], sock)
+            sock.close()
+
     @patch('src.core.node.SocketWrapper')
     def test_connect_to_tracker_success(self, mock_wrapper):
         """Test successful tracker connection"""
@@ -231,8 +490,7 @@ class TestNode(unittest.TestCase):
         self.node._handle_peer_message(msg, 'peer1')
         self.assertFalse(self.node.peer_interested.get('peer1', True))
 
-    @patch('src.core.node.MessageFactory')
-    def test_update_choking_state(self, mock_factory):
+    def test_update_choking_state(self):
         """Test choking/unchoking logic"""
         peers = {'peer1': MagicMock(), 'peer2': MagicMock()}
         self.node.peer_connections = peers
@@ -242,27 +500,46 @@ class TestNode(unittest.TestCase):
         
         self.node._update_choking_state()
         
-        peers['peer1'].send.assert_called_once_with(mock_factory.choke())
-        peers['peer2'].send.assert_called_once_with(mock_factory.unchoke())
+        peers['peer1'].send.assert_called_once_with(MessageFactory.choke())
+        peers['peer2'].send.assert_called_once_with(MessageFactory.unchoke())
+
+    def test_update_choking_unchokes_new_peers(self):
+        """Connected peers start choked and update_choking only touches those changing state"""
+        peers = {'peer1': MagicMock(), 'peer2': MagicMock()}
+        self.node.peer_connections = peers
+        self.node.choked_peers.update(peers)
+        self.node.upload_manager.get_unchoked_peers = lambda: {'peer1', 'peer3'}
+
+        self.node.update_choking()
+
+        peers['peer1'].send.assert_called_once_with(MessageFactory.unchoke())
+        peers['peer2'].send.assert_not_called()
+        self.assertEqual(self.node.unchoked_peers, {'peer1'})
+        self.assertEqual(self.node.choked_peers, {'peer2'})
 
     def test_request_timeout_handling(self):
         """Test timeout detection and requeueing"""
-        self.node.pending_requests = {
-            1: {'peer': 'peer1', 'timestamp': time.time() - 70}
-        }
-        self.node.piece_manager.check_timeouts.return_value = [2, 3]
+        self.node._track_pending_requests([1], 'peer1', time.monotonic() - 70)
+        self.node._track_pending_requests([4], 'peer1')
+        # Pieces 2 and 3 were queued too long ago without being requested
+        for piece_id in (2, 3):
+            self.node._schedule_timeout(piece_id, time.monotonic() - 70)
+        self.node.piece_manager.expire_in_progress.side_effect = lambda piece_id, timeout: piece_id in (2, 3)
         
-        self.node._process_timeout_checks()
+        next_deadline = self.node._process_timeout_checks()
         
-        self.assertEqual(self.node.request_queue.qsize(), 3)
+        self.assertEqual(sorted(piece_id for _, piece_id in self.node._rq_heap), [1, 2, 3])
+        self.node.piece_manager.check_timeouts.assert_not_called()
         self.assertNotIn(1, self.node.pending_requests)
+        self.assertIn(4, self.node.pending_requests)
+        self.assertEqual(next_deadline, self.node.pending_requests[4]['timestamp'] + self.node.request_timeout)
 
     def test_invalid_piece_response(self):
         """Test invalid piece data handling"""
         msg = MagicMock()
         msg.msg_type = "piece_response"
         msg.payload = {'piece_id': 1, 'data': b'bad'.hex()}
-        self.node.pending_requests[1] = {'peer': 'peer1', 'timestamp': time.time()}
+        self.node.pending_requests[1] = {'peer': 'peer1', 'timestamp': time.monotonic()}
         self.node.piece_manager.receive_piece.return_value = False
         
         self.node._handle_peer_message(msg, 'peer1')
@@ -282,6 +559,37 @@ class TestNode(unittest.TestCase):
         
         self.node.peer_connections['peer1'].send.assert_not_called()
 
+    def test_node_has_no_instance_dict(self):
+        """Test Node attributes live in slots"""
+        self.assertFalse(hasattr(self.node, '__dict__'))
+        with self.assertRaises(AttributeError):
+            self.node.unknown_attribute = True
+
+    @patch('src.core.node.TRACKER_RECONNECT_DELAY', 0.01)
+    def test_tracker_reconnect_backoff(self):
+        """Test repeated disconnections share one reconnect loop that retries until connected"""
+        attempts = []
+        def connect(node, host, port):
+            attempts.append((host, port))
+            if len(attempts) < 3:
+                return False
+            self.node.tracker_connection = MagicMock()
+            return True
+        self.node.running = True
+        with patch.object(Node, 'connect_to_tracker', connect):
+            worker = threading.Thread(target=self.node._reconnect_to_tracker, daemon=True)
+            worker.start()
+            
+            self.node._handle_tracker_disconnection()
+            self.node._handle_tracker_disconnection()
+            deadline = time.time() + 2.0
+            while not self.node.tracker_connection and time.time() < deadline:
+                time.sleep(0.005)
+            self.node.running = False
+            worker.join(timeout=2.0)
+        
+        self.assertEqual(len(attempts), 3)
+
 
 
 if __name__ == '__main__':
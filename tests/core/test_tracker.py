@@ -37,6 +37,17 @@ class TestTracker(unittest.TestCase):
         # Verify pieces were updated
         self.assertEqual(self.tracker.active_peers[address]['pieces'], pieces)
     
+    def test_add_peer_piece(self):
+        address = '192.168.1.10:8000'
+        self.tracker.register_peer(address)
+        self.tracker.update_peer_pieces(address, [1, 3])
+        
+        # Duplicates and invalid ids are not recorded
+        for piece_id in (5, 3, 5, None, "7", -1):
+            self.tracker.add_peer_piece(address, piece_id)
+        
+        self.assertEqual(self.tracker.active_peers[address]['pieces'], [1, 3, 5])
+    
     def test_get_all_peers(self):
         # Register multiple peers
         addresses = ['192.168.1.10:8000', '192.168.1.11:8000', '192.168.1.12:8000']
@@ -111,6 +122,21 @@ class TestTracker(unittest.TestCase):
             # Verify peer pieces were updated
             mock_update.assert_called_once_with(address, pieces)
     
+    def test_process_have_and_bitfield_messages(self):
+        address = '192.168.1.10:8000'
+        self.tracker.register_peer(address)
+        
+        # A bitfield replaces the piece list: pieces 0, 3 and 9
+        message = Message.deserialize(MessageFactory.bitfield(bytes([0b00001001, 0b00000010])))
+        self.tracker._process_message(message, MagicMock(), address)
+        self.assertEqual(self.tracker.active_peers[address]['pieces'], [0, 3, 9])
+        
+        # A have adds a single piece, once
+        for _ in range(2):
+            message = Message.deserialize(MessageFactory.have(4))
+            self.tracker._process_message(message, MagicMock(), address)
+        self.assertEqual(self.tracker.active_peers[address]['pieces'], [0, 3, 9, 4])
+    
     def test_process_get_peers_message(self):
         # Create a get_peers message
         message = Message("get_peers", {})
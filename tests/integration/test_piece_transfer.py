@@ -88,7 +88,7 @@ class TestPieceTransfer(unittest.TestCase):
         self.node2._request_piece_from_peer(0, self.node1.address)
         
         # Mock the piece response handler on node2
-        with patch.object(self.node1, '_handle_peer_message') as mock_handler:
+        with patch.object(Node, '_handle_peer_message') as mock_handler:
             # Simulate the request message being received
             mock_handler.side_effect = lambda msg, addr: self.node1._send_piece(0, addr) if msg.msg_type == 'piece_request' else None
             
@@ -64,7 +64,6 @@ class TestNodeTrackerIntegration(unittest.TestCase):
         
         # Force an update to tracker
         if self.node.tracker_connection:
-            self.node._handle_tracker_connection = True  # Signal we're connected
             self.node.announce_completion_to_tracker()
             
             # Give time for update to process
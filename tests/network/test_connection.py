@@ -1,8 +1,12 @@
+import os
+import queue
 import unittest
 import socket
+import tempfile
 from unittest.mock import MagicMock, patch
 from src.network.connection import ConnectionHandler, SocketWrapper
-from src.network.messages import Message, MessageFactory
+from src.network.messages import Message, MessageFactory, PIECE_FRAME_HEADER
+from src.config import SEND_QUEUE_MAX_SIZE, SOCKET_RCVBUF, SOCKET_SNDBUF
 
 class TestConnectionHandler(unittest.TestCase):
     def setUp(self):
@@ -17,6 +21,13 @@ class TestConnectionHandler(unittest.TestCase):
         message = b"test message"
         self.handler.send(message)
         self.assertEqual(self.handler.write_queue.get(), message)
+
+    def test_send_when_full(self):
+        self.handler.write_queue = queue.Queue(maxsize=1)
+        self.assertTrue(self.handler.send(b"first"))
+        self.assertFalse(self.handler.send(b"second"))
+        self.assertEqual(self.handler.get_next_message(timeout=0.1), b"first")
+        self.assertIsNone(self.handler.get_next_message(timeout=0.01))
     
     def test_handle_received_data(self):
         callback = MagicMock()
@@ -34,6 +45,35 @@ class TestConnectionHandler(unittest.TestCase):
         self.assertIsInstance(actual_message, Message)
         self.assertEqual(actual_message.msg_type, "peer_joined")
     
+    def test_handle_received_piece_frames(self):
+        callback = MagicMock()
+        self.handler.register_callback(callback)
+        
+        # Two frames split across reads
+        frames = MessageFactory.piece_response_binary(1, b"a" * 100) + \
+            MessageFactory.piece_response_binary(2, b"b" * 50)
+        self.handler.handle_received_data(frames[:60])
+        callback.assert_not_called()
+        self.handler.handle_received_data(frames[60:])
+        
+        self.assertEqual(callback.call_count, 2)
+        payloads = [call[0][0].payload for call in callback.call_args_list]
+        self.assertEqual(payloads, [{"piece_id": 1, "data": b"a" * 100},
+                                    {"piece_id": 2, "data": b"b" * 50}])
+        self.assertEqual(self.handler.read_buffer, bytearray())
+
+        # JSON messages sharing a read with frames
+        callback.reset_mock()
+        mixed = MessageFactory.unchoke() + MessageFactory.piece_response_binary(1, b"abc") + \
+            MessageFactory.choke() + MessageFactory.have(4)
+        self.handler.handle_received_data(mixed[:-5])
+        self.handler.handle_received_data(mixed[-5:])
+        
+        types = [call[0][0].msg_type for call in callback.call_args_list]
+        self.assertEqual(types, ["unchoke", "piece_response", "choke", "have"])
+        self.assertEqual(callback.call_args_list[1][0][0].payload, {"piece_id": 1, "data": b"abc"})
+        self.assertEqual(self.handler.read_buffer, bytearray())
+    
     def test_get_next_message(self):
         # Test with empty queue
         self.assertIsNone(self.handler.get_next_message())
@@ -63,6 +103,8 @@ class TestSocketWrapper(unittest.TestCase):
         self.assertTrue(result)
         mock_socket.assert_called_once_with(socket.AF_INET, socket.SOCK_STREAM)
         mock_socket_instance.connect.assert_called_once_with(("localhost", 8000))
+        mock_socket_instance.setsockopt.assert_any_call(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        mock_socket_instance.setsockopt.assert_any_call(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SNDBUF)
     
     @patch('socket.socket')
     def test_connect_failure_with_retry(self, mock_socket):
@@ -111,6 +153,51 @@ class TestSocketWrapper(unittest.TestCase):
         mock_socket_instance.close.assert_called_once()
         self.assertFalse(wrapper._running)
 
+    @patch('socket.socket')
+    def test_send_to_closed_wrapper(self, mock_socket):
+        wrapper = SocketWrapper("localhost", 8000)
+        wrapper.connect()
+        wrapper._cleanup()
+
+        # No writer drains the queue any more, sends must be rejected, not block
+        for _ in range(SEND_QUEUE_MAX_SIZE + 1):
+            self.assertFalse(wrapper.send(b"choke"))
+        self.assertIsNone(wrapper.handler.get_next_message())
+
+    @patch('socket.socket')
+    def test_full_queue_drops_connection(self, mock_socket):
+        mock_socket_instance = MagicMock()
+        mock_socket.return_value = mock_socket_instance
+        wrapper = SocketWrapper("localhost", 8000)
+        wrapper.connect()
+        wrapper._running = True
+        wrapper.handler.write_queue = queue.Queue(maxsize=1)
+
+        self.assertTrue(wrapper.send(b"choke"))
+        self.assertFalse(wrapper.send(b"have", droppable=True))
+        self.assertTrue(wrapper._running)
+        self.assertFalse(wrapper.send(b"unchoke"))
+        self.assertFalse(wrapper._running)
+        mock_socket_instance.shutdown.assert_called_once_with(socket.SHUT_RDWR)
+
+    def test_send_file_region(self):
+        left, right = socket.socketpair()
+        right.settimeout(5.0)
+        with tempfile.TemporaryFile() as f, left, right:
+            f.write(b"x" * 10 + b"piece data" + b"y" * 10)
+            f.flush()
+            wrapper = SocketWrapper(None, None)
+            wrapper.socket = left
+            wrapper.send_piece_zerocopy(3, os.dup(f.fileno()), 10, 10)
+            wrapper._send_file_region(wrapper.handler.get_next_message())
+
+            received = b""
+            while len(received) < PIECE_FRAME_HEADER.size + 10:
+                received += right.recv(4096)
+            message, consumed = Message.parse_piece_frame(received)
+            self.assertEqual(consumed, len(received))
+            self.assertEqual(message.payload, {"piece_id": 3, "data": b"piece data"})
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -71,6 +71,14 @@ class TestMessageFactory(unittest.TestCase):
         self.assertEqual(deserialized.msg_type, "piece_request")
         self.assertEqual(deserialized.payload, {"piece_id": piece_id})
     
+    def test_piece_request_batch_message(self):
+        piece_ids = [3, 7, 42]
+        serialized = MessageFactory.piece_request_batch(piece_ids)
+        deserialized = Message.deserialize(serialized)
+        
+        self.assertEqual(deserialized.msg_type, "piece_request_batch")
+        self.assertEqual(deserialized.payload, {"piece_ids": piece_ids})
+    
     def test_peer_list_message(self):
         peers = [{"address": "127.0.0.1:8001", "pieces": [1, 2, 3]}, 
                  {"address": "127.0.0.1:8002", "pieces": [3, 4, 5]}]
@@ -91,6 +99,29 @@ class TestMessageFactory(unittest.TestCase):
         self.assertEqual(deserialized.payload["piece_id"], piece_id)
         self.assertEqual(deserialized.payload["data"], data.hex())
 
+    def test_piece_response_binary_message(self):
+        piece_id = 42
+        data = bytes(range(256))
+        serialized = MessageFactory.piece_response_binary(piece_id, data)
+        deserialized = Message.deserialize(serialized)
+        
+        self.assertEqual(deserialized.msg_type, "piece_response")
+        self.assertEqual(deserialized.payload, {"piece_id": piece_id, "data": data})
+        
+        # Incomplete frames wait for more data
+        self.assertEqual(Message.parse_piece_frame(serialized[:-1]), (None, 0))
+
+    def test_parse_json_followed_by_messages(self):
+        choke = MessageFactory.choke()
+        data = choke + MessageFactory.have(3)
+        message, consumed = Message.parse_json(data)
+        
+        self.assertEqual(message.msg_type, "choke")
+        self.assertEqual(consumed, len(choke))
+        self.assertEqual(Message.parse_json(data[consumed:-1]), (None, 0))
+        with self.assertRaises(ValueError):
+            Message.parse_json(choke[:-1] + MessageFactory.piece_response_binary(1, b"x"))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
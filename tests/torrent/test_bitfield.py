@@ -0,0 +1,63 @@
+import unittest
+from src.torrent.bitfield import Bitfield
+
+class TestBitfield(unittest.TestCase):
+    def test_add_and_contains(self):
+        bitfield = Bitfield(10)
+        bitfield.add(0)
+        bitfield.add(9)
+        bitfield.add(9)
+        
+        self.assertIn(0, bitfield)
+        self.assertIn(9, bitfield)
+        self.assertNotIn(5, bitfield)
+        self.assertEqual(len(bitfield), 2)
+        
+    def test_bytes_roundtrip(self):
+        bitfield = Bitfield.from_pieces(10, [0, 3, 9])
+        packed = bitfield.to_bytes()
+        
+        self.assertEqual(packed, bytes([0b00001001, 0b00000010]))
+        self.assertEqual(Bitfield.from_bytes(packed, 10), bitfield)
+        self.assertEqual(len(Bitfield.from_bytes(packed)), 3)
+        
+        # Padding bits past the size are dropped
+        self.assertEqual(list(Bitfield.from_bytes(b'\xff', 3)), [0, 1, 2])
+        
+    def test_out_of_range(self):
+        bitfield = Bitfield(4)
+        self.assertNotIn(4, bitfield)
+        self.assertNotIn(-1, bitfield)
+        self.assertNotIn(None, bitfield)
+        with self.assertRaises(IndexError):
+            bitfield.add(4)
+        with self.assertRaises(IndexError):
+            Bitfield.from_pieces(4, [1, 4])
+        with self.assertRaises(IndexError):
+            Bitfield.from_pieces(4, [-1])
+            
+    def test_fill(self):
+        bitfield = Bitfield(11, fill=True)
+        self.assertEqual(len(bitfield), 11)
+        self.assertEqual(list(bitfield), list(range(11)))
+        self.assertEqual(bytes(bitfield.bits), b'\xff\x07')
+        
+    def test_discard(self):
+        bitfield = Bitfield(8, fill=True)
+        bitfield.discard(3)
+        bitfield.discard(3)
+        bitfield.discard(100)
+        
+        self.assertNotIn(3, bitfield)
+        self.assertEqual(len(bitfield), 7)
+        
+    def test_iteration_and_equality(self):
+        pieces = {1, 7, 8, 20}
+        bitfield = Bitfield.from_pieces(21, pieces)
+        
+        self.assertEqual(list(bitfield), sorted(pieces))
+        self.assertEqual(bitfield, pieces)
+        self.assertEqual(bitfield, Bitfield.from_pieces(21, pieces))
+
+if __name__ == '__main__':
+    unittest.main()